@@ -1,15 +1,42 @@
-import hashlib
+import asyncio
+import base64
+import binascii
+import json
 import logging
 import os
-from contextlib import contextmanager
-from typing import Any, Iterable, Optional
-
-import psycopg2
-from fastapi import FastAPI, HTTPException
+import math
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from contextlib import asynccontextmanager, suppress
+from contextvars import ContextVar
+from datetime import datetime
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from psycopg2 import OperationalError, errors
+from fastapi.responses import StreamingResponse
+from psycopg import AsyncConnection, OperationalError, errors
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 from pydantic import BaseModel, EmailStr
 
+from scripts.bulk_import import (
+    COPY,
+    FETCH_ALL,
+    FETCH_ONE,
+    ImportReport,
+    chunked,
+    hash_chunk,
+    load_steps,
+    parse_users,
+    record_load,
+)
+from scripts.passwords import default_hasher, hash_password, needs_rehash, verify_password
+
 PRIMARY_DB_HOST = os.getenv("PRIMARY_DB_HOST", os.getenv("DB_HOST", "db_primary"))
 REPLICA_DB_HOST = os.getenv("REPLICA_DB_HOST", "db_replica")
 DB_NAME = os.getenv("POSTGRES_DB", "auth_db")
@@ -17,6 +44,40 @@ DB_USER = os.getenv("POSTGRES_USER", "user_auth")
 DB_PASS = os.getenv("POSTGRES_PASSWORD", "password_auth")
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:8080")
 
+# Tamano y comportamiento de los pools (uno por destino: primaria y replica)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Las conexiones inactivas mas tiempo que esto se validan con SELECT 1 al sacarlas
+DB_POOL_CHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_CHECK_IDLE_SECONDS", "30"))
+# Enrutado de lecturas: por encima de este lag (segundos) se lee de la primaria
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_SAMPLE_INTERVAL = float(os.getenv("REPLICA_LAG_SAMPLE_INTERVAL", "2"))
+# Sin mensajes de la primaria (WAL o keepalive) durante mas de esto la replica se da por desconectada
+REPLICA_MAX_RECEIVER_SILENCE_SECONDS = float(os.getenv("REPLICA_MAX_RECEIVER_SILENCE_SECONDS", "60"))
+# Filas que el cursor de servidor trae por ida y vuelta en las exportaciones NDJSON
+DB_STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", "1000"))
+
+# Procesos para hashear contrasenas en POST /api/users/bulk (0 = todos los nucleos)
+BULK_IMPORT_WORKERS = int(os.getenv("BULK_IMPORT_WORKERS", "0"))
+
+# Hilos para el KDF de contrasenas (hashlib libera el GIL) y cola maxima antes de responder 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 4)))
+PASSWORD_HASH_MAX_PENDING = int(
+    os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 32))
+)
+
+# Cache de /api/login (username -> id y hash) y limite de intentos fallidos por usuario
+LOGIN_CACHE_MAX_ENTRIES = int(os.getenv("LOGIN_CACHE_MAX_ENTRIES", "10000"))
+LOGIN_CACHE_TTL = float(os.getenv("LOGIN_CACHE_TTL", "60"))
+LOGIN_NEGATIVE_CACHE_TTL = float(os.getenv("LOGIN_NEGATIVE_CACHE_TTL", "5"))
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "60"))
+
+# Paginacion por keyset de los listados
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("simple_extractor.db")
 
@@ -37,65 +98,542 @@ class TestItem(BaseModel):
     description: Optional[str] = None
 
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+class PasswordHashPool:
+    """Ejecuta el KDF en un pool de hilos acotado para que el event loop nunca se bloquee."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    async def _run(self, fn: Callable, *args: Any):
+        # Ante una rafaga es mejor rechazar rapido que acumular segundos de cola
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=503, detail="Servidor ocupado, intenta de nuevo en unos segundos."
+            )
+        self._pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(fn, *args)
+            )
+        except BaseException:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+        self._completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, stored_hash: str) -> bool:
+        return await self._run(verify_password, password, stored_hash)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scheme": default_hasher.scheme,
+            "params": default_hasher.params,
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+        }
 
+    def shutdown(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+
+password_hasher = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+class LoginCache:
+    """
+    Cache LRU con TTL de username -> (id, username, password_hash) para /api/login.
+    Los usuarios inexistentes se cachean como None con un TTL mas corto, y se cuentan
+    los fallos por username para frenar rafagas de intentos contra la misma cuenta.
+    """
+
+    MISS = object()
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        negative_ttl: float,
+        max_failures: int,
+        failure_window: float,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_failures = max_failures
+        self.failure_window = failure_window
+        self._entries: "OrderedDict[str, Tuple[float, Optional[tuple]]]" = OrderedDict()
+        self._failures: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.throttled = 0
+
+    @staticmethod
+    def _touch(store: OrderedDict, key: str, value: Any, max_entries: int) -> None:
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > max_entries:
+            store.popitem(last=False)
+
+    def get(self, username: str):
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(username, None)
+            self.misses += 1
+            return self.MISS
+        self._entries.move_to_end(username)
+        if entry[1] is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return entry[1]
+
+    def put(self, username: str, user: Optional[tuple]) -> None:
+        ttl = self.ttl if user is not None else self.negative_ttl
+        self._touch(self._entries, username, (time.monotonic() + ttl, user), self.max_entries)
+
+    def invalidate(self, username: str) -> None:
+        self._entries.pop(username, None)
+
+    def retry_after(self, username: str) -> Optional[float]:
+        """Segundos que faltan para volver a aceptar intentos, o None si no esta bloqueado."""
+        window = self._failures.get(username)
+        if window is None:
+            return None
+        remaining = window[0] + self.failure_window - time.monotonic()
+        if remaining <= 0:
+            del self._failures[username]
+            return None
+        if window[1] < self.max_failures:
+            return None
+        self.throttled += 1
+        return remaining
+
+    def record_failure(self, username: str) -> None:
+        now = time.monotonic()
+        started, count = self._failures.get(username, (now, 0))
+        if now - started > self.failure_window:
+            started, count = now, 0
+        self._touch(self._failures, username, (started, count + 1), self.max_entries)
+
+    def record_success(self, username: str) -> None:
+        self._failures.pop(username, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else None,
+            "throttled": self.throttled,
+            "tracked_failures": len(self._failures),
+        }
 
-def verify_password(plain_password: str, stored_hash: str) -> bool:
-    return hash_password(plain_password) == stored_hash
 
+login_cache = LoginCache(
+    LOGIN_CACHE_MAX_ENTRIES,
+    LOGIN_CACHE_TTL,
+    LOGIN_NEGATIVE_CACHE_TTL,
+    LOGIN_MAX_FAILURES,
+    LOGIN_FAILURE_WINDOW,
+)
 
-@contextmanager
-def _connect(host: str):
-    conn = psycopg2.connect(
-        host=host,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS,
-    )
-    try:
-        yield conn
-    finally:
-        conn.close()
 
+class DatabasePool:
+    """Pool asincrono de conexiones psycopg para un destino, con health check y metricas."""
+
+    def __init__(self, name: str, host: str, min_size: int, max_size: int):
+        self.name = name
+        self.host = host
+        self._last_used: Dict[int, float] = {}
+        self._health_check_failures = 0
+        self._pool = AsyncConnectionPool(
+            make_conninfo(host=host, dbname=DB_NAME, user=DB_USER, password=DB_PASS),
+            min_size=min_size,
+            max_size=max_size,
+            timeout=DB_POOL_TIMEOUT,
+            check=self._check,
+            reset=self._mark_returned,
+            name=name,
+            # Se abre en el arranque de la app para no exigir un event loop al importar
+            open=False,
+        )
 
-def _run_query(
+    async def _check(self, conn: AsyncConnection) -> None:
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < DB_POOL_CHECK_IDLE_SECONDS:
+            return
+        try:
+            await AsyncConnectionPool.check_connection(conn)
+        except Exception:
+            self._health_check_failures += 1
+            self._last_used.pop(id(conn), None)
+            logger.warning("[pool:%s] Conexion descartada por health check", self.name)
+            raise
+
+    async def _mark_returned(self, conn: AsyncConnection) -> None:
+        self._last_used[id(conn)] = time.monotonic()
+
+    async def open(self) -> None:
+        # wait=False: si la base aun no esta lista el pool reintenta en segundo plano
+        await self._pool.open(wait=False)
+
+    async def close(self) -> None:
+        await self._pool.close()
+        self._last_used.clear()
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None):
+        # El pool hace commit al salir sin errores y rollback si hay excepcion
+        async with self._pool.connection(timeout=timeout) as conn:
+            yield conn
+
+    def stats(self) -> Dict[str, Any]:
+        raw = self._pool.get_stats()
+        return {
+            "host": self.host,
+            "min_size": raw.get("pool_min"),
+            "max_size": raw.get("pool_max"),
+            "size": raw.get("pool_size", 0),
+            "available": raw.get("pool_available", 0),
+            "waiting": raw.get("requests_waiting", 0),
+            "checkouts": raw.get("requests_num", 0),
+            "timeouts": raw.get("requests_errors", 0),
+            "health_check_failures": self._health_check_failures,
+        }
+
+
+db_pools = {
+    "primary": DatabasePool("primary", PRIMARY_DB_HOST, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+    "replica": DatabasePool("replica", REPLICA_DB_HOST, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+}
+
+
+def _parse_lsn(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReadRouter:
+    """Envia las lecturas a la replica salvo que este caida, atrasada o detras del token del cliente."""
+
+    # Si la replica ya reprodujo todo lo recibido no hay lag, aunque la primaria este inactiva; pero
+    # "todo lo recibido" solo vale si el receptor de WAL sigue conectado (pg_stat_wal_receiver no
+    # tiene fila cuando no hay receptor, de ahi el LEFT JOIN)
+    LAG_QUERY = """
+        SELECT
+            receiver.status,
+            EXTRACT(EPOCH FROM now() - receiver.last_msg_receipt_time),
+            CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            END,
+            pg_last_wal_replay_lsn()::text
+        FROM (SELECT 1) AS one
+        LEFT JOIN pg_stat_wal_receiver AS receiver ON true
+    """
+
+    def __init__(self, max_lag_seconds: float, sample_interval: float, max_receiver_silence: float):
+        self.max_lag_seconds = max_lag_seconds
+        self.sample_interval = sample_interval
+        self.max_receiver_silence = max_receiver_silence
+        self.replica_up = False
+        self.receiver_status: Optional[str] = None
+        self.receiver_silence_seconds: Optional[float] = None
+        # None = desconocido (receptor caido o callado): cuenta como por encima del umbral
+        self.lag_seconds: Optional[float] = None
+        self.replay_lsn: Optional[str] = None
+        self.sampled_at: Optional[float] = None
+        self.routed = {"replica": 0, "primary": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def sample(self) -> None:
+        try:
+            async with db_pools["replica"].connection(timeout=self.sample_interval) as conn:
+                cursor = await conn.execute(self.LAG_QUERY)
+                receiver_status, silence, lag, replay_lsn = await cursor.fetchone()
+        except (OperationalError, PoolTimeout):
+            if self.replica_up:
+                logger.warning("[router] Replica no disponible; las lecturas van a la primaria")
+            self.replica_up = False
+            return
+
+        if not self.replica_up:
+            logger.info("[router] Replica disponible")
+        self.replica_up = True
+        self.receiver_status = receiver_status
+        self.receiver_silence_seconds = None if silence is None else float(silence)
+        connected = (
+            receiver_status == "streaming"
+            and silence is not None
+            and float(silence) <= self.max_receiver_silence
+        )
+        if not connected and self.lag_seconds is not None:
+            logger.warning(
+                "[router] Receptor de WAL de la replica desconectado (estado=%s, sin mensajes desde hace %s s)",
+                receiver_status,
+                silence,
+            )
+        self.lag_seconds = float(lag or 0) if connected else None
+        self.replay_lsn = replay_lsn
+        self.sampled_at = time.monotonic()
+
+    async def _sample_forever(self) -> None:
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.sample_interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._sample_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def mark_replica_down(self) -> None:
+        self.replica_up = False
+
+    def choose_target(self, min_lsn: Optional[str] = None) -> str:
+        target = "replica"
+        # Una muestra vieja (el muestreador se atasco) no sirve para garantizar nada
+        stale = (
+            self.sampled_at is None
+            or time.monotonic() - self.sampled_at > 3 * self.sample_interval
+        )
+        if (
+            not self.replica_up
+            or stale
+            or self.lag_seconds is None
+            or self.lag_seconds > self.max_lag_seconds
+        ):
+            target = "primary"
+        elif min_lsn is not None and (
+            self.replay_lsn is None or _parse_lsn(self.replay_lsn) < _parse_lsn(min_lsn)
+        ):
+            target = "primary"
+        self.routed[target] += 1
+        return target
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replica_up": self.replica_up,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "receiver_status": self.receiver_status,
+            "receiver_silence_seconds": self.receiver_silence_seconds,
+            "replay_lsn": self.replay_lsn,
+            "sample_age_seconds": (
+                None if self.sampled_at is None else round(time.monotonic() - self.sampled_at, 3)
+            ),
+            "routed": dict(self.routed),
+        }
+
+
+read_router = ReadRouter(
+    REPLICA_MAX_LAG_SECONDS, REPLICA_LAG_SAMPLE_INTERVAL, REPLICA_MAX_RECEIVER_SILENCE_SECONDS
+)
+# Destino de la ultima lectura de la peticion en curso (para los campos read_from)
+current_read_target: ContextVar[str] = ContextVar("current_read_target", default="replica")
+
+
+async def _run_query(
     target: str,
     query: str,
     params: Optional[Iterable[Any]] = None,
     fetch: str = "none",
+    write: bool = False,
 ):
-    host = PRIMARY_DB_HOST if target == "primary" else REPLICA_DB_HOST
-    label = "WRITE->primary" if target == "primary" else "READ->replica"
+    pool = db_pools[target]
+    label = f"{'WRITE' if write else 'READ'}->{target}"
     params = params or ()
 
     try:
-        with _connect(host) as conn:
-            with conn.cursor() as cursor:
+        async with pool.connection() as conn:
+            async with conn.cursor() as cursor:
                 logger.info("[%s] %s", label, " ".join(query.split()))
-                cursor.execute(query, params)
+                await cursor.execute(query, params)
 
-                if target == "primary":
-                    conn.commit()
+                if write:
+                    await conn.commit()
 
                 if fetch == "one":
-                    return cursor.fetchone()
+                    return await cursor.fetchone()
                 if fetch == "all":
-                    return cursor.fetchall()
+                    return await cursor.fetchall()
                 return None
-    except OperationalError as exc:
+    except (OperationalError, PoolTimeout) as exc:
         logger.exception("[%s] Error de conexion con la base de datos", label)
         raise HTTPException(
             status_code=503, detail="Servicio de base de datos no disponible."
         ) from exc
 
 
-def run_read_query(query: str, params: Optional[Iterable[Any]] = None, fetch="all"):
-    return _run_query("replica", query, params=params, fetch=fetch)
+async def run_read_query(
+    query: str,
+    params: Optional[Iterable[Any]] = None,
+    fetch="all",
+    min_lsn: Optional[str] = None,
+):
+    target = read_router.choose_target(min_lsn)
+    if target == "replica":
+        try:
+            current_read_target.set("replica")
+            return await _run_query("replica", query, params=params, fetch=fetch)
+        except HTTPException as exc:
+            if exc.status_code != 503:
+                raise
+            # La replica cayo entre dos muestras: reintentar una vez en la primaria
+            read_router.mark_replica_down()
+    current_read_target.set("primary")
+    return await _run_query("primary", query, params=params, fetch=fetch)
+
+
+async def run_write_query(query: str, params: Optional[Iterable[Any]] = None, fetch="none"):
+    return await _run_query("primary", query, params=params, fetch=fetch, write=True)
 
 
-def run_write_query(query: str, params: Optional[Iterable[Any]] = None, fetch="none"):
-    return _run_query("primary", query, params=params, fetch=fetch)
+async def consistency_token() -> str:
+    """LSN de la primaria tras una escritura; las lecturas que lo envian no veran datos anteriores."""
+    row = await _run_query("primary", "SELECT pg_current_wal_lsn()::text", fetch="one")
+    return row[0]
+
+
+def _validate_consistency_token(token: Optional[str]) -> Optional[str]:
+    if token is None:
+        return None
+    try:
+        _parse_lsn(token)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Token de consistencia invalido.") from exc
+    return token
+
+
+async def _stream_rows(target: str, query: str, params: Optional[Iterable[Any]]) -> AsyncIterator[tuple]:
+    async with db_pools[target].connection() as conn:
+        async with conn.cursor(name="ndjson_export") as cursor:
+            cursor.itersize = DB_STREAM_BATCH_SIZE
+            logger.info("[READ->%s][stream] %s", target, " ".join(query.split()))
+            await cursor.execute(query, params or ())
+            # Cursor abierto: a partir de aqui ya se puede empezar a responder
+            yield None
+            async for row in cursor:
+                yield row
+
+
+async def _open_stream(target: str, query: str, params: Optional[Iterable[Any]]) -> AsyncIterator[tuple]:
+    rows = _stream_rows(target, query, params)
+    try:
+        await rows.__anext__()
+    except (OperationalError, PoolTimeout) as exc:
+        logger.exception("[READ->%s][stream] Error de conexion con la base de datos", target)
+        raise HTTPException(
+            status_code=503, detail="Servicio de base de datos no disponible."
+        ) from exc
+    return rows
+
+
+async def stream_read_query(
+    query: str, params: Optional[Iterable[Any]] = None, min_lsn: Optional[str] = None
+) -> AsyncIterator[tuple]:
+    """
+    Itera las filas con un cursor de servidor, sin cargarlas todas en memoria.
+    La conexion se obtiene y la consulta se ejecuta antes de devolver el iterador, para que
+    los fallos acaben en 503 (o en la primaria si cae la replica) y no en una respuesta 200 cortada.
+    """
+    target = read_router.choose_target(min_lsn)
+    if target == "replica":
+        try:
+            current_read_target.set("replica")
+            return await _open_stream("replica", query, params)
+        except HTTPException:
+            read_router.mark_replica_down()
+    current_read_target.set("primary")
+    return await _open_stream("primary", query, params)
+
+
+def _encode_cursor(*values: Any) -> str:
+    raw = json.dumps(
+        [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _cursor_id(value: Any) -> int:
+    # Los id son SERIAL (int4); bool es subclase de int en Python
+    if type(value) is not int or not 0 < value < 2**31:
+        raise ValueError(value)
+    return value
+
+
+def _cursor_timestamp(value: Any) -> datetime:
+    if not isinstance(value, str):
+        raise ValueError(value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        raise ValueError(value)
+    return parsed
+
+
+def _decode_cursor(token: str, parsers: Tuple[Callable[[Any], Any], ...]) -> List[Any]:
+    """Valores del cursor `after`, uno por parser; cualquier cursor mal formado es un 400."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError(values)
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except (binascii.Error, ValueError) as exc:
+        raise HTTPException(status_code=400, detail="Cursor de paginacion invalido.") from exc
+
+
+def _ndjson_line(payload: Any) -> str:
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False) + "\n"
+
+
+def _ndjson_response(rows: AsyncIterator[tuple], to_dict: Callable[[tuple], dict]):
+    async def body():
+        async for row in rows:
+            yield _ndjson_line(to_dict(row))
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def _user_to_dict(row: tuple) -> Dict[str, Any]:
+    return {
+        "id": row[0],
+        "username": row[1],
+        "email": row[2],
+        "created_at": row[3],
+    }
+
+
+def _test_item_to_dict(row: tuple) -> Dict[str, Any]:
+    return {
+        "id": row[0],
+        "name": row[1],
+        "description": row[2],
+        "created_at": row[3].isoformat(),
+    }
 
 
 app = FastAPI(title="Docker Auth API")
@@ -114,14 +652,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Consistency-Token"],
 )
 
 
+# Indices que los listados necesitan; db/init solo se ejecuta al crear el volumen de la primaria
+STARTUP_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_test_items_created_at_id ON test_items (created_at, id)",
+)
+
+
+async def ensure_indexes() -> None:
+    for statement in STARTUP_INDEXES:
+        try:
+            await run_write_query(statement)
+        except HTTPException:
+            logger.warning("[startup] No se pudo crear el indice (se reintentara en el proximo arranque): %s", statement)
+
+
+@app.on_event("startup")
+async def open_db_pools():
+    for pool in db_pools.values():
+        await pool.open()
+    await ensure_indexes()
+    read_router.start()
+
+
+@app.on_event("shutdown")
+async def close_db_pools():
+    await read_router.stop()
+    for pool in db_pools.values():
+        await pool.close()
+    if _bulk_hash_executor is not None:
+        _bulk_hash_executor.shutdown(cancel_futures=True)
+    password_hasher.shutdown()
+
+
 @app.get("/healthz")
 async def healthcheck():
     db_status = "ok"
     try:
-        run_read_query("SELECT 1", fetch="one")
+        await _run_query("replica", "SELECT 1", fetch="one")
     except HTTPException:
         db_status = "error"
 
@@ -131,34 +702,47 @@ async def healthcheck():
         "services": {
             "database_read_replica": db_status,
         },
+        "pools": {name: pool.stats() for name, pool in db_pools.items()},
+        "read_router": read_router.stats(),
+        "password_hashing": password_hasher.stats(),
+        "login_cache": login_cache.stats(),
     }
 
 
 @app.get("/api/users")
-async def list_users():
-    rows = run_read_query(
-        "SELECT id, username, email, created_at FROM users ORDER BY id DESC",
-        fetch="all",
+async def list_users(
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    after: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    x_consistency_token: Optional[str] = Header(None),
+):
+    min_lsn = _validate_consistency_token(x_consistency_token)
+    where, params = "", []
+    if after:
+        (last_id,) = _decode_cursor(after, (_cursor_id,))
+        where, params = "WHERE id < %s", [last_id]
+    query = f"SELECT id, username, email, created_at FROM users {where} ORDER BY id DESC"
+
+    if format == "ndjson":
+        return _ndjson_response(await stream_read_query(query, params, min_lsn), _user_to_dict)
+
+    rows = await run_read_query(
+        f"{query} LIMIT %s", (*params, limit + 1), fetch="all", min_lsn=min_lsn
     )
+    rows = rows or []
+    next_cursor = _encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
     return {
-        "read_from": "replica",
-        "users": [
-            {
-                "id": row[0],
-                "username": row[1],
-                "email": row[2],
-                "created_at": row[3],
-            }
-            for row in rows or []
-        ],
+        "read_from": current_read_target.get(),
+        "users": [_user_to_dict(row) for row in rows[:limit]],
+        "next_cursor": next_cursor,
     }
 
 
 @app.post("/api/users")
-async def create_user(payload: UserCreate):
-    hashed_password = hash_password(payload.password)
+async def create_user(payload: UserCreate, response: Response):
+    hashed_password = await password_hasher.hash(payload.password)
     try:
-        row = run_write_query(
+        row = await run_write_query(
             """
             INSERT INTO users (username, email, password_hash)
             VALUES (%s, %s, %s)
@@ -171,35 +755,162 @@ async def create_user(payload: UserCreate):
         raise HTTPException(
             status_code=409, detail="El usuario o el email ya existe."
         ) from exc
+    login_cache.invalidate(payload.username)
 
+    token = await consistency_token()
+    response.headers["X-Consistency-Token"] = token
     return {
         "write_to": "primary",
-        "user": {
-            "id": row[0],
-            "username": row[1],
-            "email": row[2],
-            "created_at": row[3],
-        },
+        "user": _user_to_dict(row),
+        "consistency_token": token,
     }
 
 
-@app.post("/api/login")
-async def login(payload: LoginRequest):
+_bulk_hash_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_bulk_hash_executor() -> ProcessPoolExecutor:
+    global _bulk_hash_executor
+    if _bulk_hash_executor is None:
+        # spawn: un fork desde uvicorn, que ya tiene hilos (pool de hashing, workers de psycopg),
+        # puede heredar locks tomados y dejar el proceso hijo colgado
+        _bulk_hash_executor = ProcessPoolExecutor(
+            max_workers=BULK_IMPORT_WORKERS or None, mp_context=get_context("spawn")
+        )
+    return _bulk_hash_executor
+
+
+async def _bulk_load_users(rows, hashes, report: ImportReport, update_existing: bool):
+    """Ejecuta scripts.bulk_import.load_steps con un cursor asincrono del pool de la primaria."""
+    logger.info("[WRITE->primary][bulk] COPY de %s usuarios a users_import", len(rows))
+    steps = load_steps(rows, hashes, update_existing)
+    result = None
+    # Al salir del bloque de la conexion se hace commit; el informe se actualiza despues
+    async with db_pools["primary"].connection() as conn:
+        async with conn.cursor() as cursor:
+            while True:
+                try:
+                    action, sql, records = steps.send(result)
+                except StopIteration as stop:
+                    loaded = stop.value
+                    break
+                if action == COPY:
+                    async with cursor.copy(sql) as copy:
+                        for record in records:
+                            await copy.write_row(record)
+                    result = None
+                else:
+                    await cursor.execute(sql)
+                    if action == FETCH_ALL:
+                        result = await cursor.fetchall()
+                    elif action == FETCH_ONE:
+                        result = await cursor.fetchone()
+                    else:
+                        result = None
+    return record_load(report, loaded)
+
+
+@app.post("/api/users/bulk")
+async def bulk_create_users(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    update_existing: bool = False,
+):
+    """
+    Importa usuarios desde el cuerpo de la peticion (CSV username,email,password o NDJSON).
+    Responde en NDJSON: eventos de progreso por etapa y un resumen final con los conflictos.
+    """
     try:
-        user = run_read_query(
-            """
-            SELECT id, username, password_hash FROM users
-            WHERE username = %s
-            """,
-            (payload.username,),
-            fetch="one",
+        data = (await request.body()).decode("utf-8")
+    except UnicodeDecodeError as exc:
+        raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8.") from exc
+
+    report = ImportReport()
+    rows = parse_users(data, format, report)
+
+    async def events():
+        yield _ndjson_line({"stage": "parsed", "done": len(rows), "total": report.total})
+
+        loop = asyncio.get_running_loop()
+        executor = _get_bulk_hash_executor()
+        passwords = [row.password for row in rows]
+        futures = [
+            loop.run_in_executor(executor, partial(hash_chunk, hash_password, chunk))
+            for chunk in chunked(passwords)
+        ]
+        hashes: List[str] = []
+        for future in futures:
+            hashes.extend(await future)
+            yield _ndjson_line({"stage": "hashed", "done": len(hashes), "total": len(rows)})
+
+        try:
+            await _bulk_load_users(rows, hashes, report, update_existing)
+            for row in rows:
+                login_cache.invalidate(row.username)
+            token = await consistency_token()
+        except Exception as exc:
+            # Cualquier fallo cierra el stream con una linea de error, no con una respuesta cortada
+            logger.exception("[WRITE->primary][bulk] Fallo la importacion masiva")
+            yield _ndjson_line({"stage": "error", "detail": str(exc), **report.as_dict()})
+            return
+
+        yield _ndjson_line({"stage": "done", **report.as_dict(), "consistency_token": token})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+async def _upgrade_password_hash(user_id: int, old_hash: str, password: str) -> None:
+    """Sustituye un hash legacy (o de coste antiguo) tras un login correcto."""
+    try:
+        new_hash = await password_hasher.hash(password)
+        # La condicion sobre el hash anterior evita pisar un cambio de contrasena concurrente
+        await run_write_query(
+            "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+            (new_hash, user_id, old_hash),
         )
+    except HTTPException:
+        logger.warning("No se pudo actualizar el hash de la contrasena del usuario %s", user_id)
+
 
-        if not user or not verify_password(payload.password, user[2]):
+@app.post("/api/login")
+async def login(payload: LoginRequest, x_consistency_token: Optional[str] = Header(None)):
+    min_lsn = _validate_consistency_token(x_consistency_token)
+    retry_after = login_cache.retry_after(payload.username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiados intentos fallidos. Intenta de nuevo mas tarde.",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    try:
+        # Con token de consistencia la cache podria ser anterior a la escritura: ir a la base
+        user = login_cache.get(payload.username) if min_lsn is None else LoginCache.MISS
+        if user is LoginCache.MISS:
+            user = await run_read_query(
+                """
+                SELECT id, username, password_hash FROM users
+                WHERE username = %s
+                """,
+                (payload.username,),
+                fetch="one",
+                min_lsn=min_lsn,
+            )
+            login_cache.put(payload.username, user)
+
+        if not user or not await password_hasher.verify(payload.password, user[2]):
+            login_cache.record_failure(payload.username)
             raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
+        login_cache.record_success(payload.username)
+        if needs_rehash(user[2]):
+            login_cache.invalidate(payload.username)
+            await _upgrade_password_hash(user[0], user[2], payload.password)
+
         return {"message": "Inicio de sesión exitoso", "user": {"id": user[0], "username": user[1]}}
 
+    except HTTPException:
+        raise
     except Exception as exc:
         logger.exception("Error en el inicio de sesión")
         raise HTTPException(status_code=500, detail="Error en el servidor") from exc
@@ -207,10 +918,10 @@ async def login(payload: LoginRequest):
 
 # Endpoints de prueba
 @app.post("/test-items/")
-async def create_test_item(item: TestItem):
+async def create_test_item(item: TestItem, response: Response):
     try:
         # Insertar en la base de datos primaria
-        result = run_write_query(
+        result = await run_write_query(
             """
             INSERT INTO test_items (name, description)
             VALUES (%s, %s)
@@ -220,14 +931,12 @@ async def create_test_item(item: TestItem):
             fetch="one"
         )
         
+        token = await consistency_token()
+        response.headers["X-Consistency-Token"] = token
         return {
             "message": "Item creado exitosamente",
-            "item": {
-                "id": result[0],
-                "name": result[1],
-                "description": result[2],
-                "created_at": result[3].isoformat()
-            }
+            "item": _test_item_to_dict(result),
+            "consistency_token": token,
         }
     except Exception as exc:
         logger.exception("Error al crear el ítem de prueba")
@@ -235,28 +944,44 @@ async def create_test_item(item: TestItem):
 
 
 @app.get("/test-items/")
-async def list_test_items():
+async def list_test_items(
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    after: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    x_consistency_token: Optional[str] = Header(None),
+):
+    min_lsn = _validate_consistency_token(x_consistency_token)
+    where, params = "", []
+    if after:
+        created_at, last_id = _decode_cursor(after, (_cursor_timestamp, _cursor_id))
+        # Keyset sobre idx_test_items_created_at_id: (created_at, id) identifica cada fila
+        where, params = "WHERE (created_at, id) < (%s::timestamptz, %s)", [created_at, last_id]
+    query = f"""
+        SELECT id, name, description, created_at
+        FROM test_items
+        {where}
+        ORDER BY created_at DESC, id DESC
+    """
+
+    if format == "ndjson":
+        return _ndjson_response(
+            await stream_read_query(query, params, min_lsn), _test_item_to_dict
+        )
+
     try:
         # Leer de la réplica
-        items = run_read_query(
-            """
-            SELECT id, name, description, created_at
-            FROM test_items
-            ORDER BY created_at DESC
-            """,
-            fetch="all"
+        items = await run_read_query(
+            f"{query} LIMIT %s", (*params, limit + 1), fetch="all", min_lsn=min_lsn
         )
-        
+
+        next_cursor = None
+        if len(items) > limit:
+            last = items[limit - 1]
+            next_cursor = _encode_cursor(last[3], last[0])
+
         return {
-            "items": [
-                {
-                    "id": item[0],
-                    "name": item[1],
-                    "description": item[2],
-                    "created_at": item[3].isoformat()
-                }
-                for item in items
-            ]
+            "items": [_test_item_to_dict(item) for item in items[:limit]],
+            "next_cursor": next_cursor,
         }
     except Exception as exc:
         logger.exception("Error al listar los ítems de prueba")
@@ -23,3 +23,6 @@ CREATE TABLE IF NOT EXISTS test_items (
 
 -- Índice para búsquedas por nombre
 CREATE INDEX IF NOT EXISTS idx_test_items_name ON test_items (name);
+
+-- Índice para la paginación por keyset de /test-items/ (ORDER BY created_at DESC, id DESC)
+CREATE INDEX IF NOT EXISTS idx_test_items_created_at_id ON test_items (created_at, id);
@@ -0,0 +1,120 @@
+"""
+Cache del analisis de contraste y agrupacion de peticiones en curso.
+
+El analisis es una llamada al modelo de varios segundos cuyo resultado solo
+depende del texto de entrada, las plantillas de prompt y el modelo (ver
+analysis_cache_key en gemini/inputAnalisistxt.py). La entrada persistida es el
+propio output_analisis.txt que ya escribe el analisis, mas un archivo .json al
+lado con la clave, el sha256 del texto del analisis y los metadatos; si la clave
+coincide y el texto del archivo tiene ese hash, el resultado se sirve sin llamar
+al modelo. El archivo se escribe fuera del lock de la cache, asi que si otro
+analisis lo sobrescribe entre medias el hash no coincide y se trata como fallo.
+
+Las peticiones con la misma clave que llegan mientras otra esta en curso
+esperan su resultado en lugar de lanzar otra llamada.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple
+
+OUTPUT_HEADER = '=== ANÁLISIS COMPARATIVO ===\n\n'
+HIT = 'hit'
+MISS = 'miss'
+COALESCED = 'coalesced'
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, output_path: str, meta_path: Optional[str] = None):
+        self.output_path = output_path
+        self.meta_path = meta_path or f'{os.path.splitext(output_path)[0]}.meta.json'
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._stats = {HIT: 0, MISS: 0, COALESCED: 0}
+
+    def get_or_run(self, key: str, run: Callable[[], dict], refresh: bool = False) -> Tuple[dict, str]:
+        """
+        Devuelve (resultado, estado) con estado 'hit', 'miss' o 'coalesced'; solo se guardan los exitos.
+        Con refresh=True no se lee la cache, pero se agrupa con la peticion en curso y se guarda el resultado.
+        """
+        with self._lock:
+            cached = None if refresh else self._load(key)
+            if cached is not None:
+                self._stats[HIT] += 1
+                return cached, HIT
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self._stats[MISS] += 1
+            else:
+                self._stats[COALESCED] += 1
+
+        if not leader:
+            return future.result(), COALESCED
+
+        try:
+            result = run()
+            if result.get('success'):
+                self._store(key, result)
+            future.set_result(result)
+            return result, MISS
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Resultado guardado para `key`, o None (para las respuestas en streaming, que no se agrupan)."""
+        with self._lock:
+            cached = self._load(key)
+            self._stats[HIT if cached is not None else MISS] += 1
+            return cached
+
+    def put(self, key: str, result: dict) -> None:
+        if result.get('success'):
+            with self._lock:
+                self._store(key, result)
+
+    def _load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('key') != key:
+                return None
+            with open(self.output_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+        if content.startswith(OUTPUT_HEADER):
+            content = content[len(OUTPUT_HEADER):]
+        if _digest(content) != meta.get('analysis_sha256'):
+            return None
+        return {'success': True, 'analysis': content, 'metadata': meta.get('metadata', {})}
+
+    def _store(self, key: str, result: dict) -> None:
+        # Se guarda el hash del resultado, no del archivo: si otro analisis ya lo ha sobrescrito, no coincidira
+        try:
+            meta = {
+                'key': key,
+                'analysis_sha256': _digest(result.get('analysis') or ''),
+                'metadata': result.get('metadata', {}),
+            }
+            tmp_path = f'{self.meta_path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, self.meta_path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._in_flight)}
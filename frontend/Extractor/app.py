@@ -1,23 +1,47 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file, make_response, redirect
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file, make_response, redirect, stream_with_context
 from flask_cors import CORS, cross_origin
 from PIL import Image
 import requests
 from io import BytesIO, StringIO
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+import atexit
+import threading
 import time
 import os
 import logging
 import sys
 import pytesseract
 from werkzeug.serving import WSGIRequestHandler
-import tempfile
-from datetime import datetime
+from functools import partial
 import subprocess
 import json
-from pathlib import Path
+import re
+from urllib.parse import urlsplit
+from html.parser import HTMLParser
 from dotenv import load_dotenv
-from gemini.inputAnalisistxt import analyze_contrast_texts_from_file
+from requests.adapters import HTTPAdapter
+from gemini.inputAnalisistxt import (
+    analysis_cache_key,
+    analyze_contrast_texts,
+    analyze_contrast_texts_incremental,
+    analyze_contrast_texts_map_reduce,
+    count_tokens,
+    stream_contrast_texts,
+)
+from browser_pool import BrowserPool, BrowserPoolBusy
+from ocr import OcrCache, extract_text as ocr_extract_text, image_digest
+from ocr_jobs import JobQueueFull, OcrJobQueue
+from image_store import ImageStore
+from corpus import CorpusStore, render_entries
+from dedup import DedupIndex
+from analysis_cache import AnalysisCache
+from text_mirror import TextMirror
+from media_index import MediaIndex
+from thumbnails import WIDTHS as THUMBNAIL_WIDTHS, ThumbnailCache, negotiate_format, pick_width
+from preprocess import PRESETS as PREPROCESS_PRESETS, resolve_options as resolve_preprocess_options
 
 load_dotenv()
 
@@ -39,7 +63,7 @@ app = create_app()
 CORS(app, resources={
     r"/*": {
         "origins": "*",
-        "methods": ["GET", "POST", "OPTIONS"],
+        "methods": ["GET", "POST", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type"]
     }
 })
@@ -65,13 +89,43 @@ else:
     else:
         logger.warning(f"Tesseract not found at {linux_tesseract}. OCR may fail until it's installed.")
 
-# Create temp directory if it doesn't exist
+# Downloaded images live in temp/ (created by init_services)
 base_dir = os.path.dirname(os.path.abspath(__file__))
 temp_dir = os.path.join(base_dir, 'temp')
-os.makedirs(temp_dir, exist_ok=True)
 
 ALLOWED_THUMBNAIL_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
 
+# Sondeo de temp/ para el índice de la galería cuando watchdog no está instalado
+MEDIA_INDEX_POLL_SECONDS = float(os.environ.get('MEDIA_INDEX_POLL_SECONDS', '5'))
+
+# Cache en disco de resultados OCR (fuera de temp/ para no mezclarse con la galeria)
+OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR', os.path.join(base_dir, 'cache', 'ocr'))
+OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+
+# Variantes redimensionadas de temp/ para la galeria (/thumbnails/<archivo>?w=), generadas al pedirlas
+THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR', os.path.join(base_dir, 'cache', 'thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+# Anchura de las tarjetas de la galeria en el navegador; el srcset ofrece las demas
+THUMBNAIL_GRID_WIDTH = 320
+# Con ?v=<versión actual del archivo> la respuesta no cambia nunca; sin ella se revalida con ETag/Last-Modified
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+THUMBNAIL_REVALIDATE_MAX_AGE = 60
+
+# Trabajos OCR asincronos: procesos = nucleos disponibles salvo que se indique otra cosa
+OCR_JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', '0')) or None
+OCR_JOB_MAX_PENDING = int(os.environ.get('OCR_JOB_MAX_PENDING', '32'))
+OCR_JOB_RESULT_TTL = float(os.environ.get('OCR_JOB_RESULT_TTL', '600'))
+OCR_JOB_MAX_WAIT = float(os.environ.get('OCR_JOB_MAX_WAIT', '30'))
+OCR_BATCH_MAX_ITEMS = int(os.environ.get('OCR_BATCH_MAX_ITEMS', '100'))
+# Trabajos en curso por lote (0 = tantos como procesos OCR): un lote no llena la cola compartida
+OCR_BATCH_MAX_IN_FLIGHT = int(os.environ.get('OCR_BATCH_MAX_IN_FLIGHT', '0'))
+
+# Preprocesado OpenCV antes de Tesseract (preset por defecto; cada peticion puede cambiarlo con "preprocess")
+OCR_PREPROCESS = os.environ.get('OCR_PREPROCESS', 'fast')
+if OCR_PREPROCESS not in PREPROCESS_PRESETS:
+    logger.warning(f'OCR_PREPROCESS={OCR_PREPROCESS} no es un preset válido; se usa "none"')
+    OCR_PREPROCESS = 'none'
+
 # External scraper configuration for the carousel (served by instagram_service.py)
 INSTAGRAM_SERVICE_URL = os.environ.get('INSTAGRAM_SERVICE_URL', 'http://localhost:5001')
 INSTAGRAM_API_URL = os.environ.get('INSTAGRAM_API_URL')  # legacy direct access
@@ -79,6 +133,24 @@ INSTAGRAM_API_KEY = os.environ.get('INSTAGRAM_API_KEY')  # legacy direct access
 INSTAGRAM_DEFAULT_USERNAME = os.environ.get('INSTAGRAM_DEFAULT_USERNAME', 'instagram')
 DEFAULT_THUMBNAIL_LIMIT = int(os.environ.get('THUMBNAIL_LIMIT', '12'))
 
+# Pool de navegadores Chromium para /extract-image
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', '2'))
+BROWSER_MAX_USES = int(os.environ.get('BROWSER_MAX_USES', '50'))
+BROWSER_MAX_WAITING = int(os.environ.get('BROWSER_MAX_WAITING', '8'))
+BROWSER_CHECKOUT_TIMEOUT = float(os.environ.get('BROWSER_CHECKOUT_TIMEOUT', '30'))
+# Resolucion directa por HTTP (og:image) antes de recurrir al navegador
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+HTTP_RESOLVER_TIMEOUT = float(os.environ.get('HTTP_RESOLVER_TIMEOUT', '5'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '16'))
+# og:image solo vale si la respuesta sigue siendo la del post (no un login, perfil o aviso)
+# y la imagen viene del CDN de Instagram/Facebook; si no, se recurre al navegador
+POST_PATH_RE = re.compile(r'^/(?:[\w.]+/)?(?:p|reel|reels|tv)/[\w-]+/?$')
+POST_HOSTS = ('instagram.com', 'www.instagram.com')
+IMAGE_CDN_SUFFIXES = ('.cdninstagram.com', '.fbcdn.net')
+# Plazo maximo para que aparezca la imagen del post y cada cuanto se comprueba
+SCRAPER_WAIT_TIMEOUT = float(os.environ.get('SCRAPER_WAIT_TIMEOUT', '10'))
+SCRAPER_POLL_INTERVAL = float(os.environ.get('SCRAPER_POLL_INTERVAL', '0.2'))
+
 # Path for the text file to store all extracted text (used by Gemini)
 text_file_path = os.path.join(base_dir, 'gemini', 'extracted_texts.txt')
 # Path for the latest analysis output
@@ -86,28 +158,68 @@ analysis_output_path = os.path.join(base_dir, 'gemini', 'output_analisis.txt')
 # Path for persisted model analysis output
 analysis_output_path = os.path.join(base_dir, 'gemini', 'output_analisis.txt')
 
-# Ensure the text file exists
-try:
-    os.makedirs(os.path.dirname(text_file_path), exist_ok=True)
-    if not os.path.exists(text_file_path):
-        with open(text_file_path, 'w', encoding='utf-8') as f:
-            f.write('Archivo de textos extraídos\n' + '=' * 30 + '\n\n')
-except Exception as e:
-    logger.error(f'Error creating text file: {str(e)}')
-
-def save_extracted_text(text: str):
-    """Append extracted text to the text file with a timestamp"""
+# Corpus estructurado (SQLite, WAL): fuente de verdad de los textos extraídos.
+# extracted_texts.txt se sigue escribiendo como copia legible para los scripts legacy.
+CORPUS_DB_PATH = os.environ.get('CORPUS_DB_PATH', os.path.join(base_dir, 'gemini', 'corpus.db'))
+CORPUS_TEXT_MIRROR = os.environ.get('CORPUS_TEXT_MIRROR', '1') == '1'
+# La copia de texto rota en segmentos .txt.gz con índice de offsets al superar el tamaño o la antigüedad
+TEXT_MIRROR_MAX_BYTES = int(os.environ.get('TEXT_MIRROR_MAX_BYTES', str(5 * 1024 * 1024)))
+TEXT_MIRROR_MAX_AGE_DAYS = float(os.environ.get('TEXT_MIRROR_MAX_AGE_DAYS', '30'))
+
+# Deduplicación antes de guardar: hash del texto normalizado + SimHash (DEDUP_MAX_DISTANCE bits de 64)
+DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', '1') == '1'
+DEDUP_MAX_DISTANCE = int(os.environ.get('DEDUP_MAX_DISTANCE', '6'))
+
+# Análisis de contraste: con el corpus por encima de ANALYSIS_SINGLE_MAX_TOKENS (modo auto) se usa map-reduce.
+# El modo incremental solo envía las entradas nuevas desde el último análisis y lo actualiza.
+ANALYSIS_MODE = os.environ.get('ANALYSIS_MODE', 'auto')
+ANALYSIS_MODES = ('auto', 'single', 'map_reduce', 'incremental')
+ANALYSIS_SINGLE_MAX_TOKENS = int(os.environ.get('ANALYSIS_SINGLE_MAX_TOKENS', '12000'))
+ANALYSIS_CHUNK_TOKENS = int(os.environ.get('ANALYSIS_CHUNK_TOKENS', '6000'))
+ANALYSIS_MAP_CONCURRENCY = int(os.environ.get('ANALYSIS_MAP_CONCURRENCY', '4'))
+# Cache del último análisis (output_analisis.txt + .meta.json) y agrupación de peticiones idénticas en curso
+ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', '1') == '1'
+
+def save_extracted_texts(entries):
+    """Store several extracted texts (dicts with text, source_url, image_hash) in a single write.
+
+    Returns one result per non-empty entry: {'id': ...} or {'duplicate_of': ...} when it was not stored.
+    """
     try:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(text_file_path, 'a', encoding='utf-8') as f:
-            f.write(f'\n\n--- {timestamp} ---\n')
-            f.write(text.strip())
-            f.write('\n' + '='*50 + '\n')  # Add separator between entries
+        entries = [entry for entry in entries if entry.get('text') and entry['text'].strip()]
+        results = corpus.add_many(entries, dedup=dedup_index)
+        stored = [entry for entry, result in zip(entries, results) if 'id' in result]
+        if text_mirror is not None and stored:
+            now = time.time()
+            text_mirror.append([(now, entry['text']) for entry in stored])
+        for result in results:
+            if 'duplicate_of' in result:
+                logger.info(f'Texto descartado: duplicado de la entrada {result["duplicate_of"]}')
+        return results
     except Exception as e:
         logger.error(f'Error saving extracted text: {str(e)}')
         raise
 
 
+def save_extracted_text(text: str, source_url=None, image_hash=None):
+    """Store extracted text with a timestamp, its source URL and the image hash"""
+    results = save_extracted_texts([{'text': text, 'source_url': source_url, 'image_hash': image_hash}])
+    return results[0] if results else None
+
+
+def _saved_response_fields(result):
+    """Campos de respuesta que indican si el texto se guardó o era duplicado de otro."""
+    if not result:
+        return {}
+    if 'duplicate_of' in result:
+        return {
+            'saved': False,
+            'duplicate_of': result['duplicate_of'],
+            'message': f'Duplicado de la entrada {result["duplicate_of"]}; no se ha vuelto a guardar',
+        }
+    return {'saved': True, 'entry_id': result['id']}
+
+
 def _instagram_service_base():
     return INSTAGRAM_SERVICE_URL.rstrip('/')
 
@@ -185,7 +297,7 @@ def after_request(response):
         
     return response
 
-def obtener_imagen_instagram(url):
+def _create_chrome_driver():
     # Configurar Selenium
     chrome_options = Options()
     chrome_options.add_argument("--headless")
@@ -193,68 +305,292 @@ def obtener_imagen_instagram(url):
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("--window-size=1920,1080")
+    # No esperar a todos los recursos: la espera por selectores decide cuando hay imagen
+    chrome_options.page_load_strategy = 'eager'
     
     # Configurar el navegador para parecer más real
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-    
-    driver = webdriver.Chrome(options=chrome_options)
+    chrome_options.add_argument(f"user-agent={BROWSER_USER_AGENT}")
     
+    return webdriver.Chrome(options=chrome_options)
+
+
+# Sesion HTTP compartida: reutiliza conexiones keep-alive hacia Instagram y su CDN
+http_session = requests.Session()
+http_session.headers.update({'User-Agent': BROWSER_USER_AGENT})
+_http_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+http_session.mount('http://', _http_adapter)
+http_session.mount('https://', _http_adapter)
+
+
+# Servicios con estado (hilos, procesos, archivos abiertos): los crea init_services()
+media_index = image_store = ocr_cache = thumbnail_cache = ocr_jobs = None
+corpus = text_mirror = dedup_index = analysis_cache = browser_pool = None
+
+
+def init_services():
+    """Arranca los servicios del servidor: índice de temp/, caches, corpus, cola OCR y navegadores."""
+    global media_index, image_store, ocr_cache, thumbnail_cache, ocr_jobs
+    global corpus, text_mirror, dedup_index, analysis_cache, browser_pool
+
+    os.makedirs(temp_dir, exist_ok=True)
+    # Índice en memoria de temp/ para /api/thumbnails y /api/gallery (ImageStore lo avisa de cada escritura)
+    media_index = MediaIndex(temp_dir, ALLOWED_THUMBNAIL_EXTENSIONS, poll_interval=MEDIA_INDEX_POLL_SECONDS)
+    media_index.start()
+    atexit.register(media_index.stop)
+    # Las imagenes descargadas se guardan en temp/ con sus bytes originales, sin recomprimir
+    image_store = ImageStore(temp_dir, on_write=media_index.touch)
+
+    ocr_cache = OcrCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
+    thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+    ocr_jobs = OcrJobQueue(
+        cache=ocr_cache,
+        workers=OCR_JOB_WORKERS,
+        max_pending=OCR_JOB_MAX_PENDING,
+        result_ttl=OCR_JOB_RESULT_TTL,
+    )
+    atexit.register(ocr_jobs.close)
+
+    # Ensure the text file exists
     try:
-        # Abrir la URL
-        driver.get(url)
-        
-        # Esperar a que la página cargue completamente
-        time.sleep(5)
-        
-        # Intentar diferentes selectores comunes de Instagram
-        selectores = [
-            "//img[contains(@alt, 'Photo by')]",  # Selector por atributo alt
-            "//div[contains(@class, 'x5yr21d')]//img",  # Selector por clase contenedora
-            "//div[contains(@class, '_aagv')]//img",  # Clase común para imágenes
-            "//article//img",  # Último recurso: cualquier imagen dentro de un artículo
-            "//img[contains(@src, 'scontent.cdninstagram.com')]"  # Selector por dominio de la imagen
-        ]
-        
-        img_element = None
-        for selector in selectores:
-            try:
-                elements = driver.find_elements("xpath", selector)
-                for element in elements:
-                    src = element.get_attribute('src')
-                    if src and 'http' in src:
-                        img_element = element
-                        break
-                if img_element:
-                    break
-            except:
-                continue
-        
-        if not img_element:
-            # Tomar captura de pantalla para depuración
-            driver.save_screenshot('debug_screenshot.png')
-            print("Se ha guardado una captura de pantalla para depuración: debug_screenshot.png")
-            raise Exception("No se pudo encontrar ningún elemento de imagen con los selectores conocidos")
-        
-        img_url = img_element.get_attribute('src')
-        if not img_url:
-            raise Exception("La URL de la imagen está vacía")
-            
-        # Descargar imagen
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(img_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        img = Image.open(BytesIO(response.content))
-        logger.info(f'Imagen descargada - Dimensiones originales: {img.width}x{img.height}')
-        return img
+        os.makedirs(os.path.dirname(text_file_path), exist_ok=True)
+        if not os.path.exists(text_file_path):
+            with open(text_file_path, 'w', encoding='utf-8') as f:
+                f.write('Archivo de textos extraídos\n' + '=' * 30 + '\n\n')
+    except Exception as e:
+        logger.error(f'Error creating text file: {str(e)}')
 
+    corpus = CorpusStore(CORPUS_DB_PATH)
+    try:
+        migrated = corpus.migrate_text_file(text_file_path)
+        if migrated:
+            logger.info(f'{migrated} textos importados de {text_file_path} al corpus {CORPUS_DB_PATH}')
+    except Exception as e:
+        logger.error(f'Error migrating {text_file_path} to the corpus: {str(e)}', exc_info=True)
+    text_mirror = TextMirror(
+        text_file_path,
+        max_bytes=TEXT_MIRROR_MAX_BYTES,
+        max_age=TEXT_MIRROR_MAX_AGE_DAYS * 86400 if TEXT_MIRROR_MAX_AGE_DAYS > 0 else None,
+    ) if CORPUS_TEXT_MIRROR else None
+    dedup_index = DedupIndex(max_distance=DEDUP_MAX_DISTANCE) if DEDUP_ENABLED else None
+    if dedup_index is not None:
+        logger.info(f'Índice de duplicados cargado con {corpus.load_dedup_index(dedup_index)} textos')
+    analysis_cache = AnalysisCache(analysis_output_path) if ANALYSIS_CACHE_ENABLED else None
+
+    browser_pool = BrowserPool(
+        _create_chrome_driver,
+        size=BROWSER_POOL_SIZE,
+        max_uses=BROWSER_MAX_USES,
+        max_waiting=BROWSER_MAX_WAITING,
+        checkout_timeout=BROWSER_CHECKOUT_TIMEOUT,
+    )
+    atexit.register(browser_pool.close)
+
+
+# Cada proceso OCR (spawn) vuelve a ejecutar este archivo como __mp_main__ solo para poder
+# desempaquetar ocr.tesseract_worker: ahí no debe arrancar ningún servicio.
+if __name__ != '__mp_main__':
+    init_services()
+
+
+def _descargar_imagen(img_url):
+    """Descarga la imagen y devuelve sus bytes tal cual (se decodifican una sola vez, en quien los use)."""
+    response = http_session.get(img_url, timeout=10)
+    response.raise_for_status()
+    return response.content
+
+
+def obtener_imagen_instagram(url):
+    """Descarga (en bytes) la imagen principal de un post usando un navegador del pool.
+
+    Lanza BrowserPoolBusy si no hay navegador disponible; cualquier otro fallo devuelve None.
+    """
+    try:
+        # El navegador solo se retiene para localizar la imagen, no durante la descarga
+        with browser_pool.session() as driver:
+            img_url = _buscar_url_imagen(driver, url)
+        return _descargar_imagen(img_url)
+
+    except BrowserPoolBusy:
+        raise
     except Exception as e:
         print(f"Error al obtener la imagen: {str(e)}")
         return None
-    finally:
-        driver.quit()
+
+
+class _OpenGraphImageParser(HTMLParser):
+    """Extrae la primera <meta property="og:image"> del HTML."""
+
+    def __init__(self):
+        super().__init__()
+        self.image_url = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'meta' or self.image_url:
+            return
+        attrs = dict(attrs)
+        if (attrs.get('property') or attrs.get('name')) in ('og:image', 'og:image:secure_url'):
+            self.image_url = attrs.get('content')
+
+
+def _resolver_og_image(url):
+    """Busca la URL de la imagen en las metaetiquetas OpenGraph con una peticion HTTP simple."""
+    response = http_session.get(url, timeout=HTTP_RESOLVER_TIMEOUT)
+    response.raise_for_status()
+    if 'html' not in response.headers.get('Content-Type', ''):
+        return None
+    # Tras las redirecciones: un login, perfil o aviso trae el logo o el avatar como og:image
+    final = urlsplit(response.url)
+    if final.hostname not in POST_HOSTS or not POST_PATH_RE.match(final.path):
+        logger.info(f'[resolver] La respuesta ya no es un post ({response.url})')
+        return None
+    parser = _OpenGraphImageParser()
+    parser.feed(response.text)
+    img_url = parser.image_url
+    if not img_url:
+        return None
+    image = urlsplit(img_url)
+    if image.scheme != 'https' or not (image.hostname or '').endswith(IMAGE_CDN_SUFFIXES):
+        logger.info(f'[resolver] og:image fuera del CDN de Instagram ({img_url})')
+        return None
+    return img_url
+
+
+class ResolverStats:
+    """Peticiones y latencia acumulada por nivel del resolvedor (http, browser, failed)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {tier: {'requests': 0, 'seconds': 0.0} for tier in ('http', 'browser', 'failed')}
+
+    def record(self, tier, seconds):
+        with self._lock:
+            self._tiers[tier]['requests'] += 1
+            self._tiers[tier]['seconds'] += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                tier: {
+                    'requests': values['requests'],
+                    'avg_seconds': round(values['seconds'] / values['requests'], 3) if values['requests'] else None,
+                }
+                for tier, values in self._tiers.items()
+            }
+
+
+resolver_stats = ResolverStats()
+
+
+def resolver_imagen_instagram(url):
+    """Resolvedor por niveles: primero og:image por HTTP y, si falla, el navegador.
+
+    Devuelve (bytes de la imagen, nivel) con nivel 'http' o 'browser'; (None, None) si ninguno funciona.
+    """
+    started = time.monotonic()
+    try:
+        img_url = _resolver_og_image(url)
+        if img_url:
+            data = _descargar_imagen(img_url)
+            resolver_stats.record('http', time.monotonic() - started)
+            return data, 'http'
+        logger.info('[resolver] Sin og:image; se recurre al navegador')
+    except Exception as e:
+        logger.info(f'[resolver] Falló la ruta HTTP ({e}); se recurre al navegador')
+
+    try:
+        data = obtener_imagen_instagram(url)
+    except BrowserPoolBusy:
+        resolver_stats.record('failed', time.monotonic() - started)
+        raise
+    resolver_stats.record('browser' if data else 'failed', time.monotonic() - started)
+    return (data, 'browser') if data else (None, None)
+
+
+class SelectorStats:
+    """Aciertos por selector; los que mas aciertan se prueban primero en las siguientes peticiones."""
+
+    def __init__(self, selectors):
+        self._selectors = list(selectors)
+        self._hits = {selector: 0 for selector in self._selectors}
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def ordered(self):
+        with self._lock:
+            # sorted es estable: a igualdad de aciertos se respeta el orden original
+            return sorted(self._selectors, key=lambda selector: -self._hits[selector])
+
+    def record(self, selector):
+        with self._lock:
+            self._requests += 1
+            if selector is not None:
+                self._hits[selector] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'selectors': [
+                    {
+                        'selector': selector,
+                        'hits': self._hits[selector],
+                        'hit_rate': round(self._hits[selector] / self._requests, 4) if self._requests else None,
+                    }
+                    for selector in self._selectors
+                ],
+            }
+
+
+# Intentar diferentes selectores comunes de Instagram
+selector_stats = SelectorStats([
+    "//img[contains(@alt, 'Photo by')]",  # Selector por atributo alt
+    "//div[contains(@class, 'x5yr21d')]//img",  # Selector por clase contenedora
+    "//div[contains(@class, '_aagv')]//img",  # Clase común para imágenes
+    "//article//img",  # Último recurso: cualquier imagen dentro de un artículo
+    "//img[contains(@src, 'scontent.cdninstagram.com')]"  # Selector por dominio de la imagen
+])
+
+# Evalua todos los selectores en una sola ida y vuelta al navegador y devuelve
+# [indice, src] del primero (en el orden recibido) que tenga una imagen con URL http.
+_RACE_SELECTORS_JS = """
+const selectors = arguments[0];
+for (let i = 0; i < selectors.length; i++) {
+    const found = document.evaluate(selectors[i], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (let j = 0; j < found.snapshotLength; j++) {
+        const src = found.snapshotItem(j).src;
+        if (src && src.indexOf('http') !== -1) {
+            return [i, src];
+        }
+    }
+}
+return null;
+"""
+
+
+def _buscar_url_imagen(driver, url):
+    """Abre el post en el navegador prestado y devuelve la URL de la imagen principal.
+
+    En vez de una pausa fija, sondea todos los selectores cada SCRAPER_POLL_INTERVAL
+    segundos y termina en cuanto uno resuelve (o al vencer SCRAPER_WAIT_TIMEOUT).
+    """
+    # Abrir la URL
+    driver.get(url)
+
+    selectores = selector_stats.ordered()
+    try:
+        index, img_url = WebDriverWait(
+            driver, SCRAPER_WAIT_TIMEOUT, poll_frequency=SCRAPER_POLL_INTERVAL
+        ).until(lambda d: d.execute_script(_RACE_SELECTORS_JS, selectores))
+    except TimeoutException:
+        selector_stats.record(None)
+        # Tomar captura de pantalla para depuración
+        driver.save_screenshot('debug_screenshot.png')
+        print("Se ha guardado una captura de pantalla para depuración: debug_screenshot.png")
+        raise Exception("No se pudo encontrar ningún elemento de imagen con los selectores conocidos")
+
+    selector_stats.record(selectores[index])
+    logger.info(f'Imagen localizada con el selector {selectores[index]}')
+    return img_url
 
 @app.route('/extract-image', methods=['POST'])
 def extract_image():
@@ -262,40 +598,46 @@ def extract_image():
     data = request.get_json()
     if not data or 'url' not in data:
         return jsonify({'error': 'URL no proporcionada'}), 400
+    try:
+        preprocess = resolve_preprocess_options(data.get('preprocess'), OCR_PREPROCESS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        img = obtener_imagen_instagram(data['url'])
-        if img:
-            # Create a temporary file while preserving original image quality
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg', dir=temp_dir) as temp_file:
-                # Save with maximum quality (100) and original dimensions
-                img.save(temp_file, 'JPEG', quality=100, optimize=True, progressive=True)
-                temp_filename = os.path.basename(temp_file.name)
+        try:
+            img_data, tier = resolver_imagen_instagram(data['url'])
+        except BrowserPoolBusy as e:
+            logger.warning(f'[/extract-image] Sin navegador disponible: {e}')
+            response = jsonify({'error': 'El servidor está ocupado, intenta de nuevo en unos segundos'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        if img_data:
+            # Decodificar una vez: la misma imagen va al OCR; en disco quedan los bytes originales
+            img = Image.open(BytesIO(img_data))
+            img.load()
+            temp_filename = image_store.put(img_data, img.format)
             
             image_url = f'http://{request.host}/download/{temp_filename}'
-            logger.info(f'Imagen guardada con dimensiones originales: {img.width}x{img.height}')
+            logger.info(f'Imagen guardada sin recomprimir ({len(img_data)} bytes): {img.width}x{img.height}')
             
-            # Extract text using pytesseract
+            # El OCR se encola en segundo plano: la imagen se devuelve sin esperar a Tesseract
+            ocr_job_id = None
             try:
-                # Convert image to RGB if it's not
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Extract text in Spanish and English
-                text = pytesseract.image_to_string(img, lang='spa+eng')
-                
-                if text and text.strip():
-                    logger.info(f'Successfully extracted text: {text[:100]}...')  # Log first 100 chars
-                    save_extracted_text(text)
-                else:
-                    logger.info('No text was extracted from the image')
-            except Exception as e:
-                logger.error(f'Error extracting text: {str(e)}', exc_info=True)
-                # Continue even if text extraction fails - we still want to return the image
+                ocr_job_id = ocr_jobs.submit(
+                    lambda: img,
+                    on_text=partial(_save_ocr_text, data['url']),
+                    lang='spa+eng',
+                    preprocess=preprocess,
+                ).id
+            except JobQueueFull as e:
+                # Continue even if text extraction is not possible - we still want to return the image
+                logger.warning(f'[/extract-image] OCR omitido: {e}')
             
             return jsonify({
                 'success': True,
-                'image_url': image_url
+                'image_url': image_url,
+                'resolved_by': tier,
+                'ocr_job_id': ocr_job_id
             })
         else:
             return jsonify({'error': 'No se pudo extraer la imagen'}), 500
@@ -309,107 +651,105 @@ def download_file(filename):
     try:
         file_path = os.path.join(temp_dir, filename)
         if os.path.exists(file_path):
-            return send_file(file_path, mimetype='image/jpeg')
+            return send_file(file_path, mimetype=image_store.mimetype(filename))
         else:
             return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         logger.error(f'Error serving file {filename}: {str(e)}')
         return jsonify({'error': 'Error serving file'}), 500
 
+def _page_args():
+    """offset y limit de la query string; los valores no válidos se ignoran."""
+    def parse(name):
+        try:
+            value = int(request.args.get(name, ''))
+        except ValueError:
+            return None
+        return value if value >= 0 else None
+    return parse('offset') or 0, parse('limit')
+
+
 @app.route('/api/thumbnails', methods=['GET'])
 def list_thumbnails():
+    """Nombres de las imágenes de temp/, de la más reciente a la más antigua (?limit=&offset=)."""
     try:
-        # Get list of files from temp directory
-        files = []
-        for filename in os.listdir(temp_dir):
-            if any(filename.lower().endswith(ext) for ext in ALLOWED_THUMBNAIL_EXTENSIONS):
-                file_path = os.path.join(temp_dir, filename)
-                if os.path.isfile(file_path):
-                    mtime = os.path.getmtime(file_path)
-                    files.append({
-                        'filename': filename,
-                        'mtime': mtime
-                    })
-        
-        # Sort by modification time (newest first)
-        files.sort(key=lambda x: x['mtime'], reverse=True)
-        
-        # Apply limit if specified
-        limit = request.args.get('limit')
-        if limit:
-            try:
-                limit = int(limit)
-                files = files[:limit]
-            except ValueError:
-                pass
-        
-        # Return just the filenames for compatibility
-        result = [file_info['filename'] for file_info in files]
-        
-        return jsonify(result)
-        return jsonify(data)
+        offset, limit = _page_args()
+        return jsonify([filename for filename, _ in media_index.page(offset, limit)])
     except Exception as e:
         logger.error(f'Error listing thumbnails: {str(e)}', exc_info=True)
         return jsonify([]), 500
 
+def _media_version(mtime):
+    """Versión de un archivo de temp/ para el ?v= de sus URLs (milisegundos de su fecha de modificación)."""
+    return str(int(mtime * 1000))
+
+
 @app.route('/thumbnails/<path:filename>')
 def serve_thumbnail(filename):
+    """Imagen original de temp/, o con ?w= una variante redimensionada (WebP o JPEG según Accept o ?fmt=)."""
     # Validar el nombre del archivo para prevenir directory traversal
     safe_path = os.path.basename(filename)
     if '..' in safe_path.split(os.path.sep):
         return jsonify({'error': 'Ruta inválida'}), 400
 
     try:
-        # Servir la imagen directamente desde el directorio temp
+        # Servir la imagen desde el directorio temp
         file_path = os.path.join(temp_dir, safe_path)
-        if os.path.exists(file_path):
-            return send_file(file_path, mimetype='image/jpeg')
+        if not os.path.exists(file_path):
+            return jsonify({'error': 'Archivo no encontrado'}), 404
+        last_modified = os.path.getmtime(file_path)
+        # Los archivos de temp/ se pueden sobrescribir: solo una URL con la versión actual es inmutable
+        versioned = request.args.get('v') == _media_version(last_modified)
+        max_age = THUMBNAIL_MAX_AGE if versioned else THUMBNAIL_REVALIDATE_MAX_AGE
+
+        width = request.args.get('w', type=int)
+        if not width or width <= 0:
+            response = send_file(file_path, mimetype=image_store.mimetype(safe_path), conditional=True,
+                                 last_modified=last_modified, max_age=max_age)
         else:
+            requested_format = request.args.get('fmt')
+            fmt = negotiate_format(requested_format, request.headers.get('Accept', ''))
+            variant_path, etag = thumbnail_cache.get(file_path, pick_width(width), fmt)
+            response = send_file(variant_path, mimetype=f'image/{fmt}', conditional=True, etag=etag,
+                                 last_modified=last_modified, max_age=max_age)
+            if fmt != requested_format:
+                response.vary.add('Accept')
+        response.cache_control.public = True
+        response.cache_control.immutable = versioned
+        return response
+    except OSError as e:
+        # La original se borró o sustituyó entre la comprobación y el stat/lectura (p. ej. la limpieza de temp/)
+        if not os.path.isfile(file_path):
+            logger.info(f'Miniatura {filename} desaparecida mientras se servía: {str(e)}')
             return jsonify({'error': 'Archivo no encontrado'}), 404
+        logger.error(f'Error al servir la miniatura {filename}: {str(e)}', exc_info=True)
+        return jsonify({'error': 'Error al servir el archivo'}), 500
     except Exception as e:
         logger.error(f'Error al servir la miniatura {filename}: {str(e)}', exc_info=True)
         return jsonify({'error': 'Error al servir el archivo'}), 500
 
-def _get_sorted_media_entries():
-    if not os.path.exists(temp_dir):
-        return []
-
-    entries = []
-    try:
-        entries = [
-            entry for entry in os.scandir(temp_dir)
-            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in ALLOWED_THUMBNAIL_EXTENSIONS
-        ]
-        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
-    except Exception as exc:
-        logger.error(f'Error scanning temp_dir for media: {exc}', exc_info=True)
-    return entries
-
 @app.route('/api/gallery', methods=['GET'])
 def gallery_items():
+    """Imágenes de temp/ con su URL, de la más reciente a la más antigua (?limit=&offset=).
+
+    'url' es la original (la que usa el OCR); 'thumbnail_url' y 'srcset' apuntan a
+    variantes redimensionadas para mostrar en la cuadrícula.
+    """
     try:
-        # Obtener la lista de archivos del directorio temp
-        files = []
-        for filename in os.listdir(temp_dir):
-            if any(filename.lower().endswith(ext) for ext in ALLOWED_THUMBNAIL_EXTENSIONS):
-                file_path = os.path.join(temp_dir, filename)
-                if os.path.isfile(file_path):
-                    mtime = os.path.getmtime(file_path)
-                    files.append({
-                        'filename': filename,
-                        'mtime': mtime
-                    })
-        
-        # Ordenar por fecha de modificación (más reciente primero)
-        files.sort(key=lambda x: x['mtime'], reverse=True)
-        
+        offset, limit = _page_args()
         host = request.host_url.rstrip('/')
-        result = [{
-            'id': file_info['filename'],
-            'filename': file_info['filename'],
-            'url': f"{host}/thumbnails/{file_info['filename']}",
-            'timestamp': file_info['mtime']
-        } for file_info in files]
+        result = []
+        for filename, mtime in media_index.page(offset, limit):
+            url = f"{host}/thumbnails/{filename}"
+            version = _media_version(mtime)
+            result.append({
+                'id': filename,
+                'filename': filename,
+                'url': url,
+                'thumbnail_url': f"{url}?w={THUMBNAIL_GRID_WIDTH}&v={version}",
+                'srcset': ', '.join(f"{url}?w={width}&v={version} {width}w" for width in THUMBNAIL_WIDTHS),
+                'timestamp': mtime
+            })
 
         return jsonify(result)
     except Exception as e:
@@ -436,20 +776,23 @@ def extract_text():
         
         image_url = data['image_url']
         logger.info(f'Processing image URL: {image_url}')
+
+        try:
+            preprocess = resolve_preprocess_options(data.get('preprocess'), OCR_PREPROCESS)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        if data.get('async'):
+            return _submit_ocr_job(image_url, preprocess)
         
-        # Download the image
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
-        
-        # Open the image
-        img = Image.open(BytesIO(response.content))
-        
-        # Convert to RGB if needed (required by pytesseract)
+        # Open the image (las URLs de este mismo servicio se leen del disco, sin HTTP)
+        img = _load_image(image_url, {request.host})
+            
+        # Extract text using pytesseract (se reutiliza si los pixeles ya se procesaron)
         if img.mode != 'RGB':
             img = img.convert('RGB')
-            
-        # Extract text using pytesseract
-        text = pytesseract.image_to_string(img, lang='spa+eng')
+        image_hash = image_digest(img)
+        text = ocr_extract_text(img, cache=ocr_cache, lang='spa+eng', preprocess=preprocess, digest=image_hash)
         
         # Clean up the extracted text
         text = text.strip()
@@ -462,12 +805,13 @@ def extract_text():
             
         logger.info(f'Successfully extracted text: {text[:100]}...')
         
-        # Save the extracted text
-        save_extracted_text(text)
+        # Save the extracted text (unless it is a duplicate of an existing entry)
+        saved = save_extracted_text(text, source_url=image_url, image_hash=image_hash)
         
         return jsonify({
             'success': True,
-            'text': text
+            'text': text,
+            **_saved_response_fields(saved)
         })
         
     except requests.exceptions.RequestException as e:
@@ -484,6 +828,155 @@ def extract_text():
         }), 500
 
 
+def _save_ocr_text(source_url, text, image_hash):
+    """on_text de los trabajos OCR: guarda el texto en el corpus con su origen."""
+    return _saved_response_fields(save_extracted_text(text, source_url=source_url, image_hash=image_hash))
+
+
+def _load_image(image_url, local_hosts=()):
+    """Abre la imagen de image_url; si apunta a /download o /thumbnails de este servicio se lee de temp/."""
+    filename = image_store.resolve_local(image_url, local_hosts)
+    if filename:
+        return image_store.open_image(filename)
+    return Image.open(BytesIO(_descargar_imagen(image_url)))
+
+
+def _submit_ocr_job(image_url, preprocess):
+    """Encola el OCR de image_url y responde 202 con el id del trabajo."""
+    local_hosts = {request.host}
+    try:
+        job = ocr_jobs.submit(
+            lambda: _load_image(image_url, local_hosts),
+            on_text=partial(_save_ocr_text, image_url),
+            lang='spa+eng',
+            preprocess=preprocess,
+        )
+    except JobQueueFull as e:
+        response = jsonify({'success': False, 'error': f'{e}, intenta de nuevo en unos segundos'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'{request.host_url.rstrip("/")}/jobs/{job.id}'
+    }), 202
+
+
+def _load_batch_image(item, local_hosts=()):
+    """Un elemento del lote es una URL o el nombre de un archivo de temp/ (se lee sin pasar por HTTP)."""
+    if item.startswith(('http://', 'https://')):
+        return _load_image(item, local_hosts)
+    return image_store.open_image(item)
+
+
+@app.route('/extract-text/batch', methods=['POST', 'OPTIONS'])
+@cross_origin()
+def extract_text_batch():
+    """
+    OCR de varias imágenes en paralelo (mediante la cola de trabajos OCR).
+    Responde NDJSON: una línea por imagen en cuanto termina y una línea final de resumen.
+    Los textos se añaden al archivo de textos en una sola escritura, en el orden recibido.
+    """
+    if request.method == 'OPTIONS':
+        logger.info('[/extract-text/batch] Preflight OPTIONS recibido')
+        response = make_response()
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST')
+        return response, 200
+
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items or not all(isinstance(item, str) and item.strip() for item in items):
+        return jsonify({'success': False, 'error': 'items debe ser una lista de nombres de archivo o URLs'}), 400
+    if len(items) > OCR_BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'Como máximo {OCR_BATCH_MAX_ITEMS} imágenes por lote'}), 400
+    try:
+        preprocess = resolve_preprocess_options(data.get('preprocess'), OCR_PREPROCESS)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    items = [item.strip() for item in items]
+    save = data.get('save', True)
+    local_hosts = {request.host}
+    max_in_flight = OCR_BATCH_MAX_IN_FLIGHT or ocr_jobs.workers
+    logger.info(f'[/extract-text/batch] Lote de {len(items)} imágenes, {max_in_flight} a la vez')
+
+    def generate():
+        started = time.monotonic()
+        pending = list(enumerate(items))
+        running = {}
+        texts = {}
+        try:
+            while pending or running:
+                # Como mucho max_in_flight trabajos del lote a la vez; el resto entra a medida que terminan,
+                # así la cola sigue teniendo sitio para /extract-image y /extract-text de otros clientes
+                while pending and len(running) < max_in_flight:
+                    index, item = pending[0]
+                    try:
+                        job = ocr_jobs.submit(partial(_load_batch_image, item, local_hosts), lang='spa+eng', preprocess=preprocess)
+                    except JobQueueFull:
+                        break
+                    running[job] = pending.pop(0)
+                if not running:
+                    # La cola está llena con trabajos de otras peticiones
+                    time.sleep(0.1)
+                    continue
+
+                for job in ocr_jobs.wait_any(list(running), timeout=OCR_JOB_MAX_WAIT):
+                    index, item = running.pop(job)
+                    if job.status == 'done' and job.text:
+                        texts[index] = {'text': job.text, 'source_url': item, 'image_hash': job.image_hash}
+                    yield json.dumps({'index': index, 'item': item, **job.as_dict()}, ensure_ascii=False) + '\n'
+
+            saved, duplicates = 0, []
+            if save and texts:
+                order = sorted(texts)
+                for index, result in zip(order, save_extracted_texts([texts[index] for index in order])):
+                    if 'duplicate_of' in result:
+                        duplicates.append({'index': index, 'duplicate_of': result['duplicate_of']})
+                    else:
+                        saved += 1
+            yield json.dumps({
+                'done': True,
+                'total': len(items),
+                'with_text': len(texts),
+                'saved': saved,
+                'duplicates': duplicates,
+                'elapsed_seconds': round(time.monotonic() - started, 3),
+            }) + '\n'
+        finally:
+            # Si el cliente corta la conexión no tiene sentido terminar el resto del lote
+            for job in running:
+                ocr_jobs.cancel(job.id)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@cross_origin()
+def get_ocr_job(job_id):
+    """Estado de un trabajo OCR; con ?wait=N espera hasta N segundos a que termine (long-poll)."""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), OCR_JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'wait debe ser un número de segundos'}), 400
+
+    job = ocr_jobs.wait(job_id, wait)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, **job.as_dict()})
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+@cross_origin()
+def cancel_ocr_job(job_id):
+    job = ocr_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, **job.as_dict()})
+
+
 @app.route('/save-text', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def save_text_endpoint():
@@ -506,8 +999,8 @@ def save_text_endpoint():
             return jsonify({'success': False, 'error': 'No se proporcionó texto para guardar'}), 400
 
         if not filename or filename == 'extracted_texts.txt':
-            save_extracted_text(text)
-            return jsonify({'success': True, 'target': text_file_path})
+            saved = save_extracted_text(text)
+            return jsonify({'success': True, 'target': CORPUS_DB_PATH, **_saved_response_fields(saved)})
 
         safe_filename = filename.replace('\\', '/')
         if '..' in safe_filename:
@@ -528,31 +1021,29 @@ def save_text_endpoint():
         return jsonify({'success': False, 'error': f'Error al guardar el texto: {str(e)}'}), 500
 
 def _validate_extracted_texts(min_length: int = 10):
-    """Validates that the extracted_texts file exists and has enough content."""
-    if not os.path.exists(text_file_path):
+    """Validates that the corpus has entries and enough content (without reading the texts)."""
+    stats = corpus.stats()
+    if not stats['entries']:
         return False, {
             'success': False,
             'error': 'No hay textos para contrastar. Asegúrate de haber guardado textos primero.',
             'metadata': {
-                'source_file': text_file_path,
+                'source_file': CORPUS_DB_PATH,
                 'length': 0
             }
         }, 400
 
-    with open(text_file_path, 'r', encoding='utf-8') as f:
-        content = f.read().strip()
-
-    if len(content) <= min_length:
+    if stats['chars'] <= min_length:
         return False, {
             'success': False,
             'error': 'No hay suficiente texto para contrastar',
             'metadata': {
-                'source_file': text_file_path,
-                'length': len(content)
+                'source_file': CORPUS_DB_PATH,
+                'length': stats['chars']
             }
         }, 400
 
-    return True, {'content': content}, 200
+    return True, {'length': stats['chars'], 'entries': stats['entries']}, 200
 
 
 @app.route('/analysis-output', methods=['GET'])
@@ -590,7 +1081,7 @@ def get_analysis_output():
 def contrast_texts_new():
     """
     Endpoint principal para el botón 'Contrastar' en el frontend.
-    Utiliza gemini/inputAnalisistxt.analyze_contrast_texts_from_file.
+    Utiliza gemini/inputAnalisistxt.analyze_contrast_texts con las entradas del corpus.
     """
     if request.method == 'OPTIONS':
         logger.info('[/contrast-texts] Preflight OPTIONS recibido')
@@ -606,16 +1097,83 @@ def contrast_texts_new():
         if not is_valid:
             return jsonify(payload), status
 
-        logger.info(f'[/contrast-texts] Ejecutando análisis de contraste. Archivo: {text_file_path}')
-        analysis_result = analyze_contrast_texts_from_file(Path(text_file_path))
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode') or ANALYSIS_MODE
+        if mode not in ANALYSIS_MODES:
+            return jsonify({'success': False, 'error': f'mode debe ser uno de: {", ".join(ANALYSIS_MODES)}'}), 400
+
+        previous = corpus.last_analysis() if mode == 'incremental' else None
+        if mode == 'incremental' and previous is None:
+            logger.info('[/contrast-texts] No hay análisis anterior: se hace un análisis completo')
+            mode = 'auto'
+        entries = [dict(row) for row in corpus.entries(after_id=previous['last_entry_id'] if previous else None)]
+        if mode == 'incremental' and not entries:
+            # Nada nuevo desde el último análisis: se devuelve tal cual
+            logger.info(f'[/contrast-texts] Sin entradas nuevas desde la {previous["last_entry_id"]}')
+            unchanged = {
+                'success': True,
+                'analysis': previous['analysis'],
+                'metadata': {'mode': 'incremental', 'new_entries': 0, 'last_entry_id': previous['last_entry_id']},
+            }
+            run = lambda: unchanged
+            events = lambda: iter([{'type': 'delta', 'text': unchanged['analysis']}, {'type': 'done', **unchanged}])
+            cache_key = None
+        else:
+            last_entry_id = max(entry['id'] for entry in entries)
+            content = ''.join(render_entries(entries))
+            if mode == 'auto':
+                mode = 'map_reduce' if count_tokens(content) > ANALYSIS_SINGLE_MAX_TOKENS else 'single'
+            # Map-reduce e incremental agrupan por fuente: la fuente forma parte de la entrada
+            key_input = ''.join(f'{entry["source_url"]}\n{entry["created_at"]}\n{entry["text"]}\n' for entry in entries)
+            entry_options = {
+                'entries': entries,
+                'source_file': CORPUS_DB_PATH,
+                'chunk_tokens': ANALYSIS_CHUNK_TOKENS,
+                'concurrency': ANALYSIS_MAP_CONCURRENCY,
+            }
+            if mode == 'incremental':
+                run = partial(analyze_contrast_texts_incremental, previous['analysis'], **entry_options)
+                events = partial(stream_contrast_texts, previous_analysis=previous['analysis'], **entry_options)
+                cache_key = analysis_cache_key(previous['analysis'] + key_input, mode, chunk_tokens=ANALYSIS_CHUNK_TOKENS)
+            elif mode == 'map_reduce':
+                run = partial(analyze_contrast_texts_map_reduce, **entry_options)
+                events = partial(stream_contrast_texts, **entry_options)
+                cache_key = analysis_cache_key(key_input, mode, chunk_tokens=ANALYSIS_CHUNK_TOKENS)
+            else:
+                run = partial(analyze_contrast_texts, content, source_file=CORPUS_DB_PATH)
+                events = partial(stream_contrast_texts, content, source_file=CORPUS_DB_PATH)
+                cache_key = analysis_cache_key(content, mode)
+            if mode == 'incremental':
+                logger.info(f'[/contrast-texts] {len(entries)} entradas nuevas desde la {previous["last_entry_id"]}')
+
+        logger.info(f'[/contrast-texts] Ejecutando análisis de contraste ({mode}). Corpus: {CORPUS_DB_PATH}')
+        record = partial(_record_analysis, mode, last_entry_id) if cache_key is not None else None
+        if data.get('stream'):
+            return Response(
+                stream_with_context(_stream_contrast(events, cache_key, bool(data.get('refresh')), payload, record)),
+                mimetype='application/x-ndjson',
+            )
+
+        if cache_key is None:
+            analysis_result, cache_status = run(), 'unchanged'
+        elif analysis_cache is None:
+            analysis_result, cache_status = run(), 'disabled'
+        else:
+            analysis_result, cache_status = analysis_cache.get_or_run(cache_key, run, refresh=bool(data.get('refresh')))
+        if record is not None and analysis_result.get('success') and cache_status != 'coalesced':
+            record(analysis_result)
+        logger.info(
+            f'[/contrast-texts] Cache: {cache_status}. '
+            f'Tokens por etapa: {analysis_result.get("metadata", {}).get("tokens")}'
+        )
 
         if not analysis_result.get('success', False):
             return jsonify({
                 'success': False,
                 'error': analysis_result.get('error', 'Error desconocido al analizar el texto'),
                 'metadata': {
-                    'source_file': text_file_path,
-                    'length': len(payload.get('content', '')),
+                    'source_file': CORPUS_DB_PATH,
+                    'length': payload.get('length', 0),
                     **analysis_result.get('metadata', {})
                 }
             }), 500
@@ -626,9 +1184,10 @@ def contrast_texts_new():
             'success': True,
             'analysis': analysis_result.get('analysis', '').strip(),
             'metadata': {
-                'source_file': text_file_path,
-                'length': len(payload.get('content', '')),
-                **analysis_result.get('metadata', {})
+                'source_file': CORPUS_DB_PATH,
+                'length': payload.get('length', 0),
+                **analysis_result.get('metadata', {}),
+                'cache': cache_status,
             }
         })
 
@@ -640,6 +1199,56 @@ def contrast_texts_new():
         }), 500
 
 
+def _record_analysis(mode, last_entry_id, result):
+    """Guarda el análisis en el corpus con su marca de agua, salvo si ya es el último guardado."""
+    previous = corpus.last_analysis()
+    if previous is not None and previous['last_entry_id'] == last_entry_id and previous['analysis'] == result['analysis']:
+        return
+    corpus.add_analysis(result['analysis'], mode, last_entry_id)
+
+
+def _stream_contrast(events, cache_key, refresh, payload, record=None):
+    """NDJSON de /contrast-texts con stream: fragmentos del modelo a medida que llegan y un evento final 'done'."""
+    started = time.monotonic()
+    cached = None
+    if cache_key is not None and analysis_cache is not None and not refresh:
+        cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        events = lambda: iter([
+            {'type': 'delta', 'text': cached['analysis']},
+            {'type': 'done', **cached},
+        ])
+        cache_status = 'hit'
+    elif cache_key is None:
+        cache_status = 'unchanged'
+    else:
+        cache_status = 'disabled' if analysis_cache is None else ('refresh' if refresh else 'miss')
+
+    yield json.dumps({'type': 'start', 'cache': cache_status}) + '\n'
+    for event in events():
+        if event['type'] == 'done':
+            if event.get('success') and cache_status not in ('hit', 'unchanged') and analysis_cache is not None:
+                analysis_cache.put(cache_key, event)
+            if event.get('success') and record is not None:
+                record(event)
+            metadata = event.get('metadata', {})
+            event = {
+                **event,
+                'metadata': {
+                    'source_file': CORPUS_DB_PATH,
+                    'length': payload.get('length', 0),
+                    **metadata,
+                    'cache': cache_status,
+                    'server_seconds': round(time.monotonic() - started, 3),
+                },
+            }
+            logger.info(
+                f'[/contrast-texts] Streaming terminado. Cache: {cache_status}. '
+                f'Primer fragmento: {metadata.get("ttfb_seconds")}s, total: {metadata.get("total_seconds")}s'
+            )
+        yield json.dumps(event, ensure_ascii=False) + '\n'
+
+
 @app.route('/contrast-texts-legacy', methods=['POST', 'OPTIONS'])
 @cross_origin()
 def contrast_texts_legacy():
@@ -677,7 +1286,7 @@ def contrast_texts_legacy():
                 'error': f'Error al ejecutar el análisis: {e.stderr}',
                 'metadata': {
                     'source_file': text_file_path,
-                    'length': len(payload.get('content', ''))
+                    'length': payload.get('length', 0)
                 }
             }), 500
 
@@ -691,7 +1300,7 @@ def contrast_texts_legacy():
             'analysis': analysis_text,
             'metadata': {
                 'source_file': text_file_path,
-                'length': len(payload.get('content', ''))
+                'length': payload.get('length', 0)
             }
         })
 
@@ -729,7 +1338,7 @@ def analyze_texts():
                 'analysis': analysis_text,
                 'metadata': {
                     'source_file': text_file_path,
-                    'length': len(payload.get('content', ''))
+                    'length': payload.get('length', 0)
                 }
             })
 
@@ -750,25 +1359,24 @@ def analyze_texts():
 
 @app.route('/download-texts')
 def download_texts():
+    """Descarga el corpus como texto; ?since=<timestamp> y ?source_url=<url> limitan las entradas."""
     try:
-        # Ensure the file exists (create empty if it doesn't)
-        if not os.path.exists(text_file_path):
-            with open(text_file_path, 'w', encoding='utf-8') as f:
-                f.write('Archivo de textos extraídos\n' + '=' * 30 + '\n\n')
-            
-        # Check if file has content (more than just the header)
-        with open(text_file_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            
-        if len(content) <= 50:  # Just the header or empty
+        try:
+            since = float(request.args['since']) if request.args.get('since') else None
+        except ValueError:
+            return jsonify({'error': 'since debe ser un timestamp'}), 400
+        source_url = request.args.get('source_url') or None
+
+        if not corpus.stats()['entries']:
             return jsonify({'error': 'No se han extraído textos aún'}), 404
-            
-        return send_file(
-            text_file_path,
-            mimetype='text/plain; charset=utf-8',
-            as_attachment=True,
-            download_name='textos_extraidos.txt'
-        )
+
+        def generate():
+            yield 'Archivo de textos extraídos\n' + '=' * 30 + '\n'
+            yield from render_entries(corpus.entries(since=since, source_url=source_url))
+
+        response = Response(stream_with_context(generate()), mimetype='text/plain; charset=utf-8')
+        response.headers['Content-Disposition'] = 'attachment; filename=textos_extraidos.txt'
+        return response
     except Exception as e:
         logger.error(f'Error serving text file: {str(e)}', exc_info=True)
         return jsonify({'error': f'Error al descargar los textos: {str(e)}'}), 500
@@ -810,6 +1418,25 @@ def analysis_output():
         }), 500
 
 
+@app.route('/api/stats', methods=['GET'])
+def service_stats():
+    """Métricas internas del servicio (pool de navegadores, etc.)."""
+    return jsonify({
+        'browser_pool': browser_pool.stats(),
+        'instagram_selectors': selector_stats.stats(),
+        'image_resolver': resolver_stats.stats(),
+        'ocr_cache': ocr_cache.stats(),
+        'ocr_jobs': ocr_jobs.stats(),
+        'image_store': image_store.stats(),
+        'corpus': corpus.stats(),
+        'dedup': dedup_index.stats() if dedup_index is not None else None,
+        'analysis_cache': analysis_cache.stats() if analysis_cache is not None else None,
+        'text_mirror': text_mirror.stats() if text_mirror is not None else None,
+        'media_index': media_index.stats(),
+        'thumbnail_cache': thumbnail_cache.stats(),
+    })
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('MAIN_APP_PORT', '5000'))
     app.run(debug=True, host='0.0.0.0', port=port)
@@ -0,0 +1,165 @@
+"""
+Pool acotado de sesiones Chromium (Selenium) reutilizables entre peticiones.
+
+Arrancar Chromium cuesta segundos y cientos de MB; el pool mantiene hasta `size`
+navegadores vivos, los presta con checkout/checkin y los recicla tras `max_uses`
+usos o si fallan. Cuando todos estan ocupados las peticiones esperan en una cola
+de como mucho `max_waiting` huecos; mas alla se rechazan con BrowserPoolBusy.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List
+
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPoolBusy(Exception):
+    """Todas las sesiones estan ocupadas y la cola de espera esta llena (o vencio el timeout)."""
+
+
+class BrowserSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+    def is_alive(self) -> bool:
+        try:
+            # Cualquier llamada al driver falla si Chromium murio
+            self.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception as exc:
+            logger.warning(f'Error al cerrar una sesion de Chromium: {exc}')
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        driver_factory: Callable,
+        size: int = 2,
+        max_uses: int = 50,
+        max_waiting: int = 8,
+        checkout_timeout: float = 30.0,
+    ):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_uses = max_uses
+        self.max_waiting = max_waiting
+        self.checkout_timeout = checkout_timeout
+        self._idle: List[BrowserSession] = []
+        self._total = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {'checkouts': 0, 'created': 0, 'recycled': 0, 'crashed': 0, 'rejected': 0}
+
+    def _checkout(self) -> BrowserSession:
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise BrowserPoolBusy('El pool de navegadores esta cerrado')
+                if not self._idle and self._total >= self.size and self._waiting >= self.max_waiting:
+                    self._stats['rejected'] += 1
+                    raise BrowserPoolBusy('Todos los navegadores estan ocupados')
+
+                self._waiting += 1
+                try:
+                    deadline = time.monotonic() + self.checkout_timeout
+                    while not self._idle and self._total >= self.size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            self._stats['rejected'] += 1
+                            raise BrowserPoolBusy('Tiempo de espera agotado para obtener un navegador')
+                finally:
+                    self._waiting -= 1
+
+                self._stats['checkouts'] += 1
+                session = self._idle.pop() if self._idle else None
+                if session is None:
+                    # Reservar el hueco antes de arrancar Chromium fuera del lock
+                    self._total += 1
+
+            if session is None:
+                return self._start_session()
+            if session.is_alive():
+                return session
+            # Chromium murio mientras estaba inactivo: liberar el hueco y volver a intentarlo
+            session.quit()
+            with self._cond:
+                self._total -= 1
+                self._stats['crashed'] += 1
+
+    def _start_session(self) -> BrowserSession:
+        try:
+            session = BrowserSession(self.driver_factory())
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return session
+
+    def _checkin(self, session: BrowserSession, broken: bool) -> None:
+        session.uses += 1
+        retire = broken or self._closed or session.uses >= self.max_uses
+        if not retire:
+            try:
+                # Reutilizar la misma pestana, pero soltar la pagina anterior
+                session.driver.get('about:blank')
+            except WebDriverException:
+                retire = True
+
+        with self._cond:
+            if retire:
+                self._total -= 1
+                self._stats['crashed' if broken else 'recycled'] += 1
+            else:
+                self._idle.append(session)
+            self._cond.notify()
+        if retire:
+            session.quit()
+
+    @contextmanager
+    def session(self):
+        """Presta un driver; si Chromium muere durante el uso la sesion se descarta en vez de devolverse."""
+        session = self._checkout()
+        broken = False
+        try:
+            yield session.driver
+        except WebDriverException:
+            broken = not session.is_alive()
+            raise
+        finally:
+            self._checkin(session, broken)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'size': self.size,
+                'alive': self._total,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'max_waiting': self.max_waiting,
+                **self._stats,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for session in idle:
+            session.quit()
@@ -0,0 +1,278 @@
+"""
+Corpus de textos extraidos en SQLite (modo WAL).
+
+Cada extraccion es una fila con fecha, URL de origen, hash de la imagen y texto,
+con indices por fecha y por origen, de modo que las lecturas solo traen las
+entradas que necesitan. WAL permite leer mientras otros hilos escriben; cada
+hilo usa su propia conexion y las escrituras por lotes van en una transaccion.
+
+La tabla counters tiene una sola fila con el numero de entradas, los caracteres
+y la ultima entrada; se actualiza en la misma transaccion que cada insercion, asi
+que stats() (y la validacion antes de un analisis) no recorre la tabla entries.
+
+La tabla analyses guarda cada analisis de contraste junto con el id de la
+ultima entrada que cubria (la marca de agua del modo incremental).
+
+El formato de texto de extracted_texts.txt ("--- fecha ---", texto y una linea
+de "=") se conserva en render_entries() para los consumidores que esperan
+texto plano, y migrate_text_file() importa ese archivo una sola vez.
+
+Uso desde la linea de comandos:
+
+    python corpus.py migrate gemini/extracted_texts.txt gemini/corpus.db
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    source_url TEXT,
+    image_hash TEXT,
+    text TEXT NOT NULL,
+    char_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries (created_at);
+CREATE INDEX IF NOT EXISTS idx_entries_source_url ON entries (source_url, created_at);
+CREATE TABLE IF NOT EXISTS counters (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    chars INTEGER NOT NULL,
+    last_id INTEGER,
+    last_created_at REAL
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    mode TEXT NOT NULL,
+    last_entry_id INTEGER NOT NULL,
+    analysis TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at REAL NOT NULL,
+    rows INTEGER NOT NULL
+);
+"""
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+SEPARATOR = '=' * 50
+LEGACY_HEADER_RE = re.compile(r'^--- (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) ---$')
+
+
+class CorpusStore:
+    def __init__(self, path: str, busy_timeout: float = 10.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            if conn.execute('SELECT 1 FROM counters WHERE id = 1').fetchone() is None:
+                # Corpus creado antes de existir counters: un unico recorrido para inicializarla
+                conn.execute(
+                    'INSERT INTO counters (id, entries, chars, last_id, last_created_at) '
+                    'SELECT 1, count(*), COALESCE(sum(char_count), 0), max(id), max(created_at) FROM entries'
+                )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add_many(self, entries: Sequence[dict], dedup=None) -> List[dict]:
+        """
+        Inserta varias entradas (text, source_url, image_hash, created_at opcional) en una transaccion.
+        Con un DedupIndex, los duplicados (tambien dentro del propio lote) no se insertan.
+        Devuelve por entrada {'id': ...} o {'duplicate_of': ...}.
+        """
+        now = time.time()
+        results, added, inserted = [], [], []
+        with self._write_lock:
+            conn = self._connection()
+            try:
+                with conn:
+                    for entry in entries:
+                        text = entry['text'].strip()
+                        duplicate_of = dedup.find(text) if dedup is not None else None
+                        if duplicate_of is not None:
+                            results.append({'duplicate_of': duplicate_of})
+                            continue
+                        created_at = entry.get('created_at') or now
+                        cursor = conn.execute(
+                            'INSERT INTO entries (created_at, source_url, image_hash, text, char_count) '
+                            'VALUES (?, ?, ?, ?, ?)',
+                            (created_at, entry.get('source_url'), entry.get('image_hash'), text, len(text)),
+                        )
+                        results.append({'id': cursor.lastrowid})
+                        inserted.append((cursor.lastrowid, created_at, len(text)))
+                        if dedup is not None:
+                            dedup.add(text, cursor.lastrowid)
+                            added.append((text, cursor.lastrowid))
+                    self._bump_counters(conn, inserted)
+            except Exception:
+                # La transaccion se deshizo: quitar del indice lo que no llego a guardarse
+                for text, entry_id in added:
+                    dedup.remove(text, entry_id)
+                raise
+        return results
+
+    @staticmethod
+    def _bump_counters(conn: sqlite3.Connection, inserted: Sequence[tuple]) -> None:
+        """Suma las filas (id, created_at, caracteres) recien insertadas a counters, dentro de la transaccion abierta."""
+        if not inserted:
+            return
+        conn.execute(
+            'UPDATE counters SET entries = entries + ?, chars = chars + ?, '
+            'last_id = max(COALESCE(last_id, 0), ?), last_created_at = max(COALESCE(last_created_at, 0), ?) '
+            'WHERE id = 1',
+            (len(inserted), sum(chars for _, _, chars in inserted),
+             max(entry_id for entry_id, _, _ in inserted), max(created_at for _, created_at, _ in inserted)),
+        )
+
+    def add(self, text: str, source_url: Optional[str] = None, image_hash: Optional[str] = None, dedup=None) -> dict:
+        return self.add_many([{'text': text, 'source_url': source_url, 'image_hash': image_hash}], dedup)[0]
+
+    def load_dedup_index(self, dedup) -> int:
+        """Rellena un DedupIndex con todas las entradas existentes (al arrancar)."""
+        count = 0
+        for row in self._connection().execute('SELECT id, text FROM entries ORDER BY id'):
+            dedup.add(row['text'], row['id'])
+            count += 1
+        return count
+
+    def entries(
+        self,
+        since: Optional[float] = None,
+        source_url: Optional[str] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[sqlite3.Row]:
+        """Entradas en orden cronologico, filtradas por fecha, origen o id (para leer de forma incremental)."""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if source_url is not None:
+            clauses.append('source_url = ?')
+            params.append(source_url)
+        if after_id is not None:
+            clauses.append('id > ?')
+            params.append(after_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        sql = f'SELECT id, created_at, source_url, image_hash, text FROM entries {where} ORDER BY created_at, id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return iter(self._connection().execute(sql, params))
+
+    def stats(self) -> dict:
+        """Entradas, caracteres y ultima entrada leidos de la fila de counters (sin recorrer entries)."""
+        row = self._connection().execute(
+            'SELECT entries, chars, last_id, last_created_at FROM counters WHERE id = 1'
+        ).fetchone()
+        return {'entries': row[0], 'chars': row[1], 'last_id': row[2], 'last_created_at': row[3]}
+
+    def add_analysis(self, analysis: str, mode: str, last_entry_id: int) -> int:
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    'INSERT INTO analyses (created_at, mode, last_entry_id, analysis) VALUES (?, ?, ?, ?)',
+                    (time.time(), mode, last_entry_id, analysis),
+                )
+        return cursor.lastrowid
+
+    def last_analysis(self) -> Optional[dict]:
+        """Ultimo analisis guardado (id, created_at, mode, last_entry_id, analysis), o None."""
+        row = self._connection().execute(
+            'SELECT id, created_at, mode, last_entry_id, analysis FROM analyses ORDER BY id DESC LIMIT 1'
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def migrate_text_file(self, text_path: str) -> int:
+        """Importa extracted_texts.txt una sola vez; devuelve las filas importadas (0 si ya se hizo)."""
+        name = f'text_file:{os.path.abspath(text_path)}'
+        conn = self._connection()
+        if conn.execute('SELECT 1 FROM migrations WHERE name = ?', (name,)).fetchone():
+            return 0
+        entries = list(parse_text_file(text_path)) if os.path.exists(text_path) else []
+        with self._write_lock, conn:
+            inserted = []
+            for created_at, text in entries:
+                cursor = conn.execute(
+                    'INSERT INTO entries (created_at, source_url, image_hash, text, char_count) '
+                    'VALUES (?, NULL, NULL, ?, ?)',
+                    (created_at, text, len(text)),
+                )
+                inserted.append((cursor.lastrowid, created_at, len(text)))
+            self._bump_counters(conn, inserted)
+            conn.execute(
+                'INSERT INTO migrations (name, applied_at, rows) VALUES (?, ?, ?)', (name, time.time(), len(entries))
+            )
+        return len(entries)
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def parse_text_file(text_path: str) -> Iterator[tuple]:
+    """Recorre los bloques "--- fecha ---" del formato antiguo y devuelve (timestamp, texto)."""
+    created_at, lines = None, []
+    with open(text_path, 'r', encoding='utf-8') as f:
+        for raw in f:
+            line = raw.rstrip('\n')
+            match = LEGACY_HEADER_RE.match(line)
+            if match:
+                created_at = datetime.strptime(match.group(1), TIMESTAMP_FORMAT).timestamp()
+                lines = []
+            elif created_at is not None and line == SEPARATOR:
+                text = '\n'.join(lines).strip()
+                if text:
+                    yield created_at, text
+                created_at, lines = None, []
+            elif created_at is not None:
+                lines.append(line)
+
+
+def format_entry(created_at: float, text: str) -> str:
+    timestamp = datetime.fromtimestamp(created_at).strftime(TIMESTAMP_FORMAT)
+    return f'\n\n--- {timestamp} ---\n{text.strip()}\n{SEPARATOR}\n'
+
+
+def render_entries(entries: Iterable) -> Iterator[str]:
+    """Bloques en el formato de extracted_texts.txt, para prompts y descargas."""
+    for entry in entries:
+        yield format_entry(entry['created_at'], entry['text'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Herramientas del corpus de textos extraidos')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help='Importa un extracted_texts.txt al corpus SQLite')
+    migrate.add_argument('text_file')
+    migrate.add_argument('database')
+    args = parser.parse_args()
+
+    store = CorpusStore(args.database)
+    rows = store.migrate_text_file(args.text_file)
+    print(f'{rows} entradas importadas; el corpus tiene {store.stats()["entries"]}')
+
+
+if __name__ == '__main__':
+    main()
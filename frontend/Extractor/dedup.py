@@ -0,0 +1,147 @@
+"""
+Deteccion de textos duplicados o casi duplicados antes de guardarlos en el corpus.
+
+Dos niveles, ambos con indices en memoria de coste O(1) por consulta:
+
+- Exacto: hash del texto normalizado (minusculas, sin acentos ni puntuacion y
+  con los espacios colapsados). Detecta el mismo titular leido dos veces.
+- Aproximado: SimHash de 64 bits sobre trigramas de caracteres. Dos textos son casi
+  duplicados si sus huellas difieren en como mucho `max_distance` bits (el OCR
+  de dos capturas de la misma imagen rara vez coincide letra a letra). La huella
+  se parte en max_distance + t bloques y se indexa en una tabla por cada
+  combinacion de t bloques (las tablas permutadas de Manku et al.): dos huellas a
+  esa distancia difieren en como mucho max_distance bloques, asi que coinciden
+  del todo en los t restantes y se encuentran en esa tabla. t se elige para que
+  cada clave tenga al menos KEY_BITS bits; con claves mas cortas cada cubo
+  acumularia una fraccion fija del corpus y las consultas volverian a ser O(n).
+"""
+import hashlib
+import itertools
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+# Bits minimos de la clave de cada tabla: con huellas aleatorias cada cubo recibe ~n / 2**KEY_BITS textos
+KEY_BITS = 16
+# Por encima las tablas se disparan (495 con 8) y a esa distancia ya se parecen textos distintos
+MAX_DISTANCE_LIMIT = 7
+# Por debajo de estos caracteres la huella es poco fiable y solo se usa el hash exacto
+MIN_SIMHASH_CHARS = 30
+_NON_WORD_RE = re.compile(r'[^\w\s]+')
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    without_accents = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(_NON_WORD_RE.sub(' ', without_accents).split())
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(normalized: str) -> int:
+    # Trigramas de caracteres: un error de OCR en una letra solo cambia unos pocos rasgos
+    features = [normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = _feature_hash(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def table_masks(max_distance: int) -> List[int]:
+    """Mascara de cada tabla: la union de t de los max_distance + t bloques de la huella."""
+    # El menor t cuyos t bloques (de 64 / (max_distance + t) bits) suman KEY_BITS; el numero de
+    # tablas, C(max_distance + t, t), crece deprisa: 28 con max_distance=6, 120 con 7
+    kept = 1
+    while kept * (SIMHASH_BITS // (max_distance + kept)) < KEY_BITS:
+        kept += 1
+    blocks = max_distance + kept
+    width, extra = divmod(SIMHASH_BITS, blocks)
+    block_masks, shift = [], 0
+    for block in range(blocks):
+        block_width = width + (1 if block < extra else 0)
+        block_masks.append(((1 << block_width) - 1) << shift)
+        shift += block_width
+    return [sum(combination) for combination in itertools.combinations(block_masks, kept)]
+
+
+class DedupIndex:
+    def __init__(self, max_distance: int = 6):
+        if not 0 <= max_distance <= MAX_DISTANCE_LIMIT:
+            raise ValueError(f'max_distance debe estar entre 0 y {MAX_DISTANCE_LIMIT}')
+        self.max_distance = max_distance
+        self._tables = table_masks(max_distance)
+        self._lock = threading.Lock()
+        self._exact: Dict[str, int] = {}
+        self._fingerprints: Dict[int, int] = {}
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in self._tables]
+        self._stats = {'checked': 0, 'exact_duplicates': 0, 'near_duplicates': 0, 'candidates': 0}
+
+    @staticmethod
+    def fingerprint(text: str) -> Tuple[str, Optional[int]]:
+        normalized = normalize(text)
+        exact = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        return exact, simhash(normalized) if len(normalized) >= MIN_SIMHASH_CHARS else None
+
+    def find(self, text: str) -> Optional[int]:
+        """Id de la entrada de la que `text` es duplicado, o None."""
+        exact, fingerprint = self.fingerprint(text)
+        with self._lock:
+            self._stats['checked'] += 1
+            entry_id = self._exact.get(exact)
+            if entry_id is not None:
+                self._stats['exact_duplicates'] += 1
+                return entry_id
+            if fingerprint is None:
+                return None
+            candidates = set()
+            for mask, buckets in zip(self._tables, self._buckets):
+                candidates |= buckets.get(fingerprint & mask, set())
+            self._stats['candidates'] += len(candidates)
+            matches = [
+                candidate for candidate in candidates
+                if bin(self._fingerprints[candidate] ^ fingerprint).count('1') <= self.max_distance
+            ]
+            if matches:
+                self._stats['near_duplicates'] += 1
+                return min(matches)
+            return None
+
+    def add(self, text: str, entry_id: int) -> None:
+        exact, fingerprint = self.fingerprint(text)
+        with self._lock:
+            self._exact.setdefault(exact, entry_id)
+            if fingerprint is None:
+                return
+            self._fingerprints[entry_id] = fingerprint
+            for mask, buckets in zip(self._tables, self._buckets):
+                buckets.setdefault(fingerprint & mask, set()).add(entry_id)
+
+    def remove(self, text: str, entry_id: int) -> None:
+        exact, fingerprint = self.fingerprint(text)
+        with self._lock:
+            if self._exact.get(exact) == entry_id:
+                del self._exact[exact]
+            if self._fingerprints.pop(entry_id, None) is None:
+                return
+            for mask, buckets in zip(self._tables, self._buckets):
+                bucket = buckets.get(fingerprint & mask)
+                if bucket is not None:
+                    bucket.discard(entry_id)
+                    if not bucket:
+                        del buckets[fingerprint & mask]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_distance': self.max_distance,
+                'tables': len(self._tables),
+                'indexed': len(self._exact),
+                **self._stats,
+            }
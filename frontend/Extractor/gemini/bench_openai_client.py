@@ -0,0 +1,104 @@
+"""
+Benchmark del coste por llamada de crear un cliente de OpenAI en cada análisis
+frente a reutilizar el cliente compartido de inputAnalisistxt.get_client().
+
+Levanta un servidor HTTP local que imita /v1/chat/completions (con un retardo
+fijo que simula el modelo) y cuenta las conexiones TCP que recibe. Ejemplo:
+
+    python bench_openai_client.py --calls 50 --latency 0.02
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+import inputAnalisistxt
+
+COMPLETION = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": inputAnalisistxt.MODEL,
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # cabeceras y cuerpo van en escrituras separadas
+    latency = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandInHandler.lock:
+            StandInHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        body = json.dumps(COMPLETION).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def per_call_client(base_url):
+    # Lo que se hacía antes: buscar el .env y crear un cliente (y su pool de conexiones) en cada análisis
+    inputAnalisistxt._load_env.__wrapped__()
+    client = OpenAI(api_key="bench", base_url=base_url)
+    try:
+        inputAnalisistxt._complete(client, "hola")
+    finally:
+        client.close()
+
+
+def shared_client(base_url):
+    inputAnalisistxt._complete(inputAnalisistxt.get_client(), "hola")
+
+
+def bench(name, call, base_url, calls):
+    StandInHandler.connections = 0
+    call(base_url)  # calentamiento
+    start = time.perf_counter()
+    for _ in range(calls):
+        call(base_url)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12}{elapsed / calls * 1000:>12.2f}{StandInHandler.connections:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos de respuesta simulados")
+    args = parser.parse_args()
+
+    StandInHandler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    try:
+        print(f"{args.calls} llamadas, latencia simulada {args.latency * 1000:.0f} ms")
+        print(f"{'cliente':<12}{'ms/llamada':>12}{'conexiones':>14}")
+        bench("por llamada", per_call_client, base_url, args.calls)
+        bench("compartido", shared_client, base_url, args.calls)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,137 +1,30 @@
+import hashlib
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+import httpx
 from dotenv import load_dotenv
 from openai import OpenAI
 from datetime import datetime
 
+try:
+    import tiktoken
+except ImportError:  # está en requirements.txt; sin él los tokens se estiman por caracteres
+    tiktoken = None
 
-def main():
-    result = analyze_contrast_texts_from_file()
-    if result["success"]:
-        print("\nAnálisis completado:")
-        print("-" * 80)
-        print(result["analysis"])
-        print("-" * 80)
-        
-        # Guardar en archivo
-        try:
-            from datetime import datetime
-            import os
-            
-            # Crear directorio de salida si no existe
-            output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analisis")
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # Crear nombre de archivo con timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file = os.path.join(output_dir, f"analisis_{timestamp}.txt")
-            
-            # Escribir el análisis en el archivo
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write("=== ANÁLISIS POLÍTICO ===\n\n")
-                f.write(f"Fecha del análisis: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Archivo analizado: {result.get('metadata', {}).get('source_file', 'N/A')}\n")
-                f.write("-" * 80 + "\n\n")
-                f.write(result["analysis"])
-                f.write("\n\n" + "=" * 80 + "\n")
-                f.write("Fin del análisis")
-            
-            print(f"\n✅ Análisis guardado en: {os.path.abspath(output_file)}")
-            
-        except Exception as e:
-            print(f"\n❌ Error al guardar el archivo: {str(e)}")
-    else:
-        print(f"\n❌ Error: {result.get('error', 'Error desconocido')}")
-def _safe_source_path(file_path):
-    """
-    Devuelve una representación de ruta segura para JSON (string o None).
-    """
-    if file_path is None:
-        return None
-    return str(file_path)
-
-
-def analyze_contrast_texts_from_file(file_path=None):
-    """
-    Analiza el contenido de un archivo de texto usando el modelo de OpenAI.
-    Si no se proporciona una ruta, usa 'extracted_texts.txt' en el mismo directorio.
-
-    Args:
-        file_path (str | Path | None): Ruta al archivo de texto a analizar.
-
-    Returns:
-        dict: Un diccionario con los campos:
-            - success (bool): Indica si el análisis fue exitoso
-            - analysis (str): El resultado del análisis
-            - metadata (dict): Metadatos sobre el análisis
-            - error (str, opcional): Mensaje de error si algo falla
-    """
-    try:
-        print("Iniciando análisis de contraste...")
-
-        # Cargar variables de entorno (intenta varias ubicaciones)
-        env_candidates = [
-            Path(__file__).resolve().parent.parent / ".env",   # frontend/Extractor/.env
-            Path(__file__).resolve().parents[2] / ".env",      # frontend/.env
-            Path(__file__).resolve().parents[3] / ".env",      # raíz del proyecto
-        ]
-        loaded_env = False
-        for env_path in env_candidates:
-            if env_path.exists():
-                load_dotenv(env_path, override=False)
-                loaded_env = True
-                break
-        if not loaded_env:
-            print("Aviso: no se encontró .env en rutas conocidas; se intentará usar las variables de entorno existentes.")
-
-        # Verificar API key
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            error_msg = "Error: OPENAI_API_KEY no está configurada en el entorno"
-            print(error_msg)
-            return {
-                "success": False,
-                "error": error_msg,
-                "metadata": {"source_file": _safe_source_path(file_path)},
-            }
-
-        # Establecer la ruta por defecto si no se proporciona
-        if file_path is None:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            file_path = os.path.join(script_dir, "extracted_texts.txt")
-
-        print(f"Leyendo archivo: {file_path}")
-
-        # Leer el archivo
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                texto = f.read().strip()
-
-            if not texto:
-                error_msg = (
-                    "El archivo está vacío. No hay texto para analizar."
-                )
-                print(error_msg)
-                return {
-                    "success": False,
-                    "error": error_msg,
-                    "metadata": {
-                        "source_file": _safe_source_path(file_path),
-                        "length": 0,
-                    },
-                }
-
-            print(
-                f"Texto leído correctamente. Tamaño: {len(texto)} caracteres"
-            )
+MODEL = "gpt-5"
+# Tamaño máximo de cada bloque del modo map-reduce y llamadas simultáneas en la fase map
+DEFAULT_CHUNK_TOKENS = 6000
+DEFAULT_MAP_CONCURRENCY = 4
+CHARS_PER_TOKEN = 4
 
-            # Configurar el cliente de OpenAI
-            client = OpenAI(api_key=api_key)
-
-            # Crear el prompt para análisis político
-            prompt = f"""
-            # 📰 Rol Ligero de Analista Comparativo de Noticias
+# Plantilla del analisis de contraste; {texto} son los textos a comparar
+CONTRAST_PROMPT = """
+        # 📰 Rol Ligero de Analista Comparativo de Noticias
 
 ## 🎯 Rol
 Eres un **analista comparativo de noticias**. Tu trabajo es **contrastar de manera clara, breve y profesional** entre 2 y 4 fuentes informativas sobre un mismo tema.  
@@ -213,67 +106,609 @@ Un párrafo final donde sintetices:
 ## 📌 Ejemplo de Formato de Salida
 
 
-            Texto a analizar:
-            {texto}
+        Texto a analizar:
+        {texto}
 
-            Por favor, organiza la respuesta de manera clara y estructurada, utilizando encabezados y viñetas para facilitar la lectura. Mantén un tono profesional y objetivo en todo momento, respaldando tus observaciones con ejemplos concretos del texto cuando sea posible.
-            """
+        Por favor, organiza la respuesta de manera clara y estructurada, utilizando encabezados y viñetas para facilitar la lectura. Mantén un tono profesional y objetivo en todo momento, respaldando tus observaciones con ejemplos concretos del texto cuando sea posible.
+        """
 
-            print("\nEnviando solicitud al modelo...")
+# Fase map: notas breves por bloque que luego se contrastan con CONTRAST_PROMPT
+MAP_PROMPT = """
+Eres un analista comparativo de noticias. A continuación hay textos extraídos de
+publicaciones, cada uno precedido de su fuente y fecha.
 
-            # Llamar al modelo
-            completion = client.chat.completions.create(
-                model="gpt-5",
-                messages=[{"role": "user", "content": prompt}],
-            )
+Para cada fuente, resume en viñetas breves:
+- Tema principal de cada noticia
+- Foco y omisiones relevantes
+- Tono y lenguaje
+- Sesgo o encuadre narrativo
+- Actores responsabilizados o favorecidos
+- Citas o datos concretos que lo respalden
 
-            # Obtener la respuesta
-            analysis_result = completion.choices[0].message.content
-
-            # Guardar el análisis en output_analisis.txt
-            output_path = Path(__file__).parent / "output_analisis.txt"
-            try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write("=== ANÁLISIS COMPARATIVO ===\n\n")
-                    f.write(analysis_result)
-                print(f"\n✅ Análisis guardado en: {output_path}")
-            except Exception as e:
-                print(f"\n⚠️ No se pudo guardar el análisis en {output_path}: {str(e)}")
-
-            print("\nAnálisis completado exitosamente")
-
-            return {
-                "success": True,
-                "analysis": analysis_result,
-                "metadata": {
-                    "source_file": _safe_source_path(file_path),
-                    "output_file": str(output_path),
-                    "length": len(texto),
-                },
-            }
-
-        except FileNotFoundError:
-            error_msg = f"Error: No se encontró el archivo en {file_path}"
-            print(error_msg)
-            return {
-                "success": False,
-                "error": error_msg,
-                "metadata": {"source_file": _safe_source_path(file_path)},
-            }
+No compares todavía entre fuentes; conserva el nombre de cada fuente.
 
-    except Exception as e:
-        error_msg = f"Error inesperado: {str(e)}"
+Textos:
+{texto}
+"""
+
+# Fase combine: agrupa notas de la fase map cuando juntas no caben en un bloque
+COMBINE_PROMPT = """
+A continuación hay notas de análisis de noticias agrupadas por fuente. Fusiónalas
+en unas notas más breves con la misma estructura, sin perder fuentes, temas,
+sesgos, actores ni citas relevantes.
+
+Notas:
+{texto}
+"""
+
+# Análisis incremental: el análisis anterior hace de resumen acumulado y solo se envía lo nuevo
+MERGE_PROMPT = """
+Eres un analista comparativo de noticias. Tienes un análisis comparativo anterior y
+los textos extraídos después de hacerlo, cada uno precedido de su fuente y fecha
+(o notas ya resumidas de ellos).
+
+Actualiza el análisis incorporando lo nuevo: añade las fuentes y temas nuevos, ajusta
+el tono, los sesgos, los actores, la tabla y la conclusión donde cambien y conserva
+lo que siga siendo válido. Devuelve el análisis completo actualizado, con la misma
+estructura de encabezados, viñetas y tabla.
+
+Análisis anterior:
+{anterior}
+
+Textos nuevos:
+{texto}
+"""
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """Tokens de `text` con tiktoken si está instalado; si no, una estimación por caracteres."""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Prefijo de `text` de como mucho max_tokens tokens (según count_tokens)."""
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN - 1]
+    tokens = encoding.encode(text)
+    limit = max_tokens
+    truncated = encoding.decode(tokens[:limit])
+    # Al cortar por tokens la última palabra puede volver a codificarse en uno más
+    while limit > 0 and len(encoding.encode(truncated)) > max_tokens:
+        limit -= 1
+        truncated = encoding.decode(tokens[:limit])
+    return truncated
+
+
+
+def main():
+    result = analyze_contrast_texts_from_file()
+    if result["success"]:
+        print("\nAnálisis completado:")
+        print("-" * 80)
+        print(result["analysis"])
+        print("-" * 80)
+        
+        # Guardar en archivo
+        try:
+            from datetime import datetime
+            import os
+            
+            # Crear directorio de salida si no existe
+            output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analisis")
+            os.makedirs(output_dir, exist_ok=True)
+            
+            # Crear nombre de archivo con timestamp
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_file = os.path.join(output_dir, f"analisis_{timestamp}.txt")
+            
+            # Escribir el análisis en el archivo
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write("=== ANÁLISIS POLÍTICO ===\n\n")
+                f.write(f"Fecha del análisis: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"Archivo analizado: {result.get('metadata', {}).get('source_file', 'N/A')}\n")
+                f.write("-" * 80 + "\n\n")
+                f.write(result["analysis"])
+                f.write("\n\n" + "=" * 80 + "\n")
+                f.write("Fin del análisis")
+            
+            print(f"\n✅ Análisis guardado en: {os.path.abspath(output_file)}")
+            
+        except Exception as e:
+            print(f"\n❌ Error al guardar el archivo: {str(e)}")
+    else:
+        print(f"\n❌ Error: {result.get('error', 'Error desconocido')}")
+def _safe_source_path(file_path):
+    """
+    Devuelve una representación de ruta segura para JSON (string o None).
+    """
+    if file_path is None:
+        return None
+    return str(file_path)
+
+
+def analyze_contrast_texts_from_file(file_path=None):
+    """
+    Analiza el contenido de un archivo de texto usando el modelo de OpenAI.
+    Si no se proporciona una ruta, usa 'extracted_texts.txt' en el mismo directorio.
+
+    Args:
+        file_path (str | Path | None): Ruta al archivo de texto a analizar.
+
+    Returns:
+        dict: el mismo resultado que analyze_contrast_texts.
+    """
+    # Establecer la ruta por defecto si no se proporciona
+    if file_path is None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        file_path = os.path.join(script_dir, "extracted_texts.txt")
+
+    print(f"Leyendo archivo: {file_path}")
+
+    # Leer el archivo
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            texto = f.read()
+    except FileNotFoundError:
+        error_msg = f"Error: No se encontró el archivo en {file_path}"
         print(error_msg)
         return {
             "success": False,
             "error": error_msg,
+            "metadata": {"source_file": _safe_source_path(file_path)},
+        }
+
+    return analyze_contrast_texts(texto, source_file=file_path)
+
+
+def analysis_cache_key(texto, mode="single", **params):
+    """Hash del texto de entrada, las plantillas de prompt, el modelo y los parámetros que cambian el resultado."""
+    templates = {
+        "single": (CONTRAST_PROMPT,),
+        "map_reduce": (CONTRAST_PROMPT, MAP_PROMPT, COMBINE_PROMPT),
+        "incremental": (MERGE_PROMPT, MAP_PROMPT, COMBINE_PROMPT),
+    }[mode]
+    digest = hashlib.sha256()
+    for part in (MODEL, mode, *templates, *(f"{name}={params[name]}" for name in sorted(params)), texto):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _load_env():
+    """Carga variables de entorno desde el primer .env encontrado (intenta varias ubicaciones); solo una vez."""
+    env_candidates = [
+        Path(__file__).resolve().parent.parent / ".env",   # frontend/Extractor/.env
+        Path(__file__).resolve().parents[2] / ".env",      # frontend/.env
+        Path(__file__).resolve().parents[3] / ".env",      # raíz del proyecto
+    ]
+    for env_path in env_candidates:
+        if env_path.exists():
+            load_dotenv(env_path, override=False)
+            return True
+    print("Aviso: no se encontró .env en rutas conocidas; se intentará usar las variables de entorno existentes.")
+    return False
+
+
+def _error_result(error_msg, source_file, **metadata):
+    print(error_msg)
+    return {
+        "success": False,
+        "error": error_msg,
+        "metadata": {"source_file": _safe_source_path(source_file), **metadata},
+    }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Cliente de OpenAI compartido, creado la primera vez que se usa; None si falta OPENAI_API_KEY.
+
+    Un único cliente reutiliza las conexiones HTTP (keep-alive) entre análisis en vez de
+    abrir un pool y negociar TLS en cada llamada. Configuración por variables de entorno:
+    OPENAI_TIMEOUT y OPENAI_CONNECT_TIMEOUT (segundos), OPENAI_MAX_RETRIES (reintentos del
+    SDK, con espera exponencial y aleatoria ante 429, 5xx y errores de conexión),
+    OPENAI_MAX_CONNECTIONS y OPENAI_BASE_URL.
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            _load_env()
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                return None
+            max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "8"))
+            _client = OpenAI(
+                api_key=api_key,
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+                timeout=httpx.Timeout(
+                    float(os.getenv("OPENAI_TIMEOUT", "300")),
+                    connect=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10")),
+                ),
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                ),
+            )
+    return _client
+
+
+def _complete(client, prompt):
+    """Llama al modelo y devuelve (texto, uso de tokens)."""
+    completion = client.chat.completions.create(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    usage = getattr(completion, "usage", None)
+    tokens = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or count_tokens(prompt),
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+    }
+    return completion.choices[0].message.content, tokens
+
+
+def _save_analysis(analysis_result):
+    """Guarda el análisis en output_analisis.txt y devuelve la ruta."""
+    output_path = Path(__file__).parent / "output_analisis.txt"
+    try:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write("=== ANÁLISIS COMPARATIVO ===\n\n")
+            f.write(analysis_result)
+        print(f"\n✅ Análisis guardado en: {output_path}")
+    except Exception as e:
+        print(f"\n⚠️ No se pudo guardar el análisis en {output_path}: {str(e)}")
+    return output_path
+
+
+def analyze_contrast_texts(texto, source_file=None):
+    """
+    Analiza un texto ya cargado (p. ej. las entradas del corpus) usando el modelo de OpenAI.
+
+    Args:
+        texto (str): Textos extraídos a contrastar.
+        source_file (str | Path | None): Origen del texto, solo para los metadatos.
+
+    Returns:
+        dict: Un diccionario con los campos:
+            - success (bool): Indica si el análisis fue exitoso
+            - analysis (str): El resultado del análisis
+            - metadata (dict): Metadatos sobre el análisis (incluye los tokens usados)
+            - error (str, opcional): Mensaje de error si algo falla
+    """
+    try:
+        print("Iniciando análisis de contraste...")
+
+        client = get_client()
+        if client is None:
+            return _error_result("Error: OPENAI_API_KEY no está configurada en el entorno", source_file)
+
+        texto = texto.strip()
+        if not texto:
+            return _error_result("El archivo está vacío. No hay texto para analizar.", source_file, length=0)
+
+        print(
+            f"Texto leído correctamente. Tamaño: {len(texto)} caracteres"
+        )
+
+        # Crear el prompt para análisis político
+        prompt = CONTRAST_PROMPT.format(texto=texto)
+
+        print("\nEnviando solicitud al modelo...")
+
+        analysis_result, tokens = _complete(client, prompt)
+        output_path = _save_analysis(analysis_result)
+
+        print("\nAnálisis completado exitosamente")
+
+        return {
+            "success": True,
+            "analysis": analysis_result,
+            "metadata": {
+                "source_file": _safe_source_path(source_file),
+                "output_file": str(output_path),
+                "length": len(texto),
+                "mode": "single",
+                "tokens": {"single": {"calls": 1, **tokens}},
+            },
+        }
+
+    except Exception as e:
+        return _error_result(f"Error inesperado: {str(e)}", source_file)
+
+
+def chunk_entries(entries, max_tokens=DEFAULT_CHUNK_TOKENS):
+    """
+    Agrupa las entradas del corpus (dicts con text, source_url y created_at) en bloques
+    de como mucho max_tokens. Las entradas de una misma fuente van juntas y en orden;
+    una fuente solo se parte entre bloques si no cabe entera en uno.
+
+    Returns:
+        list: [{"sources": [...], "text": str, "tokens": int}, ...]
+    """
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry.get("source_url") or "Sin fuente", []).append(entry)
+
+    chunks = []
+    current, current_sources, current_tokens = [], [], 0
+
+    def flush():
+        nonlocal current, current_sources, current_tokens
+        if current:
+            chunks.append({"sources": current_sources, "text": "\n\n".join(current), "tokens": current_tokens})
+        current, current_sources, current_tokens = [], [], 0
+
+    for source, items in groups.items():
+        blocks = []
+        for entry in items:
+            fecha = datetime.fromtimestamp(entry["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+            block = f"[Fuente: {source} | {fecha}]\n{entry['text'].strip()}"
+            tokens = count_tokens(block)
+            if tokens > max_tokens:
+                # Un único texto más largo que el bloque: se recorta en vez de desbordar el contexto
+                block = truncate_to_tokens(block, max_tokens)
+                tokens = count_tokens(block)
+            blocks.append((block, tokens))
+        if current and current_tokens + sum(tokens for _, tokens in blocks) > max_tokens:
+            flush()
+        for block, tokens in blocks:
+            if current and current_tokens + tokens > max_tokens:
+                flush()
+            current.append(block)
+            current_tokens += tokens
+            if source not in current_sources:
+                current_sources.append(source)
+    flush()
+    return chunks
+
+
+def _add_usage(stage_tokens, tokens):
+    stage_tokens["calls"] += 1
+    stage_tokens["prompt_tokens"] += tokens["prompt_tokens"]
+    stage_tokens["completion_tokens"] += tokens["completion_tokens"]
+
+
+def _map_chunks(client, chunks, prompt_template, concurrency, stage_tokens):
+    """Aplica prompt_template a cada bloque con como mucho `concurrency` llamadas a la vez; conserva el orden."""
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as executor:
+        results = list(executor.map(lambda chunk: _complete(client, prompt_template.format(texto=chunk["text"])), chunks))
+    for _, tokens in results:
+        _add_usage(stage_tokens, tokens)
+    return [notes for notes, _ in results]
+
+
+def _empty_usage(stages=("map", "combine", "reduce")):
+    return {stage: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0} for stage in stages}
+
+
+def _map_reduce_notes(client, chunks, chunk_tokens, concurrency, tokens):
+    """Fases map y combine: notas por bloque, reagrupadas hasta que juntas quepan en chunk_tokens."""
+    print(f"{len(chunks)} bloques de hasta {chunk_tokens} tokens")
+    notes = _map_chunks(client, chunks, MAP_PROMPT, concurrency, tokens["map"])
+    while len(notes) > 1 and count_tokens("\n\n".join(notes)) > chunk_tokens:
+        note_entries = [{"source_url": f"Notas {i + 1}", "created_at": time.time(), "text": n} for i, n in enumerate(notes)]
+        grouped = chunk_entries(note_entries, chunk_tokens)
+        if len(grouped) >= len(notes):
+            break  # ya no se puede agrupar más: el reduce recibirá las notas tal cual
+        notes = _map_chunks(client, grouped, COMBINE_PROMPT, concurrency, tokens["combine"])
+    return notes
+
+
+def _final_prompt(client, chunks, previous_analysis, chunk_tokens, concurrency, tokens):
+    """
+    Prompt de la última llamada a partir de los bloques de entradas: CONTRAST_PROMPT sobre las
+    notas del map o, con un análisis anterior, MERGE_PROMPT con él y lo nuevo (tal cual si cabe
+    en un bloque, resumido con el map si no).
+    """
+    if previous_analysis is None:
+        return CONTRAST_PROMPT.format(texto="\n\n".join(_map_reduce_notes(client, chunks, chunk_tokens, concurrency, tokens)))
+    if len(chunks) == 1:
+        nuevo = chunks[0]["text"]
+    else:
+        nuevo = "\n\n".join(_map_reduce_notes(client, chunks, chunk_tokens, concurrency, tokens))
+    return MERGE_PROMPT.format(anterior=previous_analysis.strip(), texto=nuevo)
+
+
+def _analyze_entries(entries, source_file, chunk_tokens, concurrency, previous_analysis=None):
+    mode = "map_reduce" if previous_analysis is None else "incremental"
+    final_stage = "reduce" if previous_analysis is None else "merge"
+    try:
+        print(f"Iniciando análisis de contraste ({mode})...")
+
+        client = get_client()
+        if client is None:
+            return _error_result("Error: OPENAI_API_KEY no está configurada en el entorno", source_file)
+
+        entries = [entry for entry in entries if entry["text"].strip()]
+        if not entries:
+            return _error_result("El archivo está vacío. No hay texto para analizar.", source_file, length=0)
+
+        tokens = _empty_usage(("map", "combine", final_stage))
+        chunks = chunk_entries(entries, chunk_tokens)
+        prompt = _final_prompt(client, chunks, previous_analysis, chunk_tokens, concurrency, tokens)
+
+        analysis_result, final_tokens = _complete(client, prompt)
+        _add_usage(tokens[final_stage], final_tokens)
+        output_path = _save_analysis(analysis_result)
+
+        print("\nAnálisis completado exitosamente")
+
+        return {
+            "success": True,
+            "analysis": analysis_result,
+            "metadata": {
+                "source_file": _safe_source_path(source_file),
+                "output_file": str(output_path),
+                "length": sum(len(entry["text"]) for entry in entries),
+                "mode": mode,
+                "chunks": len(chunks),
+                "tokens": tokens,
+            },
+        }
+
+    except Exception as e:
+        return _error_result(f"Error inesperado: {str(e)}", source_file)
+
+
+def analyze_contrast_texts_map_reduce(
+    entries,
+    source_file=None,
+    chunk_tokens=DEFAULT_CHUNK_TOKENS,
+    concurrency=DEFAULT_MAP_CONCURRENCY,
+):
+    """
+    Análisis map-reduce para corpus que no caben en un solo prompt.
+
+    - map: cada bloque (agrupado por fuente, ver chunk_entries) se resume en notas
+      de encuadre, con como mucho `concurrency` llamadas simultáneas.
+    - combine: si las notas juntas siguen sin caber en chunk_tokens, se vuelven a
+      agrupar y resumir hasta que quepan.
+    - reduce: CONTRAST_PROMPT sobre las notas de todas las fuentes.
+
+    Returns:
+        dict: igual que analyze_contrast_texts; metadata.tokens trae llamadas y tokens por etapa.
+    """
+    return _analyze_entries(entries, source_file, chunk_tokens, concurrency)
+
+
+def analyze_contrast_texts_incremental(
+    previous_analysis,
+    entries,
+    source_file=None,
+    chunk_tokens=DEFAULT_CHUNK_TOKENS,
+    concurrency=DEFAULT_MAP_CONCURRENCY,
+):
+    """
+    Actualiza un análisis anterior solo con las entradas nuevas desde entonces (fase merge).
+
+    El prompt lleva el análisis anterior como resumen acumulado más las entradas nuevas; si
+    estas no caben en un bloque de chunk_tokens, antes se resumen con la fase map. El coste
+    depende del texto nuevo y no de todo el historial.
+
+    Returns:
+        dict: igual que analyze_contrast_texts; metadata.tokens trae map, combine y merge.
+    """
+    return _analyze_entries(entries, source_file, chunk_tokens, concurrency, previous_analysis=previous_analysis)
+
+
+def _stream_complete(client, prompt, tokens):
+    """Como _complete, pero genera los fragmentos de texto a medida que llegan; rellena `tokens` al final."""
+    stream = client.chat.completions.create(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    for chunk in stream:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None:
+            tokens["prompt_tokens"] = usage.prompt_tokens
+            tokens["completion_tokens"] = usage.completion_tokens
+        for choice in chunk.choices:
+            if choice.delta.content:
+                yield choice.delta.content
+
+
+def stream_contrast_texts(
+    texto=None,
+    entries=None,
+    source_file=None,
+    chunk_tokens=DEFAULT_CHUNK_TOKENS,
+    concurrency=DEFAULT_MAP_CONCURRENCY,
+    previous_analysis=None,
+):
+    """
+    Versión en streaming del análisis: con `texto` equivale a analyze_contrast_texts, con
+    `entries` a analyze_contrast_texts_map_reduce y con `entries` y `previous_analysis` a
+    analyze_contrast_texts_incremental (solo se transmite la última llamada).
+
+    Genera eventos (dicts):
+        - {"type": "stage", "stage": ...} al empezar cada fase
+        - {"type": "delta", "text": ...} por cada fragmento del modelo
+        - {"type": "done", "success": True, "analysis": ..., "metadata": ...} al final, con el
+          texto completo ya guardado en output_analisis.txt; metadata incluye ttfb_seconds
+          (hasta el primer fragmento) y total_seconds
+        - {"type": "done", "success": False, "error": ..., "metadata": ...} si algo falla
+    """
+    started = time.monotonic()
+    try:
+        client = get_client()
+        if client is None:
+            yield {"type": "done", **_error_result("Error: OPENAI_API_KEY no está configurada en el entorno", source_file)}
+            return
+
+        metadata = {"source_file": _safe_source_path(source_file)}
+        if entries is not None:
+            entries = [entry for entry in entries if entry["text"].strip()]
+            texto = "".join(entry["text"] for entry in entries)
+        texto = (texto or "").strip()
+        if not texto:
+            yield {"type": "done", **_error_result("El archivo está vacío. No hay texto para analizar.", source_file, length=0)}
+            return
+
+        if entries is not None:
+            final_stage = "reduce" if previous_analysis is None else "merge"
+            tokens = _empty_usage(("map", "combine", final_stage))
+            chunks = chunk_entries(entries, chunk_tokens)
+            if previous_analysis is None or len(chunks) > 1:
+                yield {"type": "stage", "stage": "map", "chunks": len(chunks)}
+            prompt = _final_prompt(client, chunks, previous_analysis, chunk_tokens, concurrency, tokens)
+            reduce_tokens = tokens[final_stage]
+            mode = "map_reduce" if previous_analysis is None else "incremental"
+            metadata.update(mode=mode, chunks=len(chunks), tokens=tokens)
+        else:
+            final_stage = "single"
+            prompt = CONTRAST_PROMPT.format(texto=texto)
+            reduce_tokens = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+            metadata.update(mode="single", tokens={"single": reduce_tokens})
+
+        yield {"type": "stage", "stage": final_stage}
+        parts, ttfb = [], None
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": 0}
+        for delta in _stream_complete(client, prompt, usage):
+            if ttfb is None:
+                ttfb = time.monotonic() - started
+            parts.append(delta)
+            yield {"type": "delta", "text": delta}
+        _add_usage(reduce_tokens, usage)
+
+        analysis_result = "".join(parts)
+        output_path = _save_analysis(analysis_result)
+        yield {
+            "type": "done",
+            "success": True,
+            "analysis": analysis_result,
             "metadata": {
-                "source_file": _safe_source_path(
-                    file_path if "file_path" in locals() else None
-                )
+                **metadata,
+                "output_file": str(output_path),
+                "length": len(texto),
+                "ttfb_seconds": round(ttfb if ttfb is not None else time.monotonic() - started, 3),
+                "total_seconds": round(time.monotonic() - started, 3),
             },
         }
 
+    except Exception as e:
+        yield {"type": "done", **_error_result(f"Error inesperado: {str(e)}", source_file)}
+
 
 # Mantener la función main para compatibilidad
 def main():
@@ -0,0 +1,96 @@
+"""
+Almacen interno de imagenes descargadas.
+
+Guarda los bytes originales tal como llegaron (sin recomprimir) en un archivo
+cuyo nombre es el hash de su contenido, de modo que una misma imagen se escribe
+una sola vez. Tambien reconoce las URLs que apuntan a este mismo servicio
+(/download/<archivo> y /thumbnails/<archivo>) para leerlas del disco en lugar de
+hacer una peticion HTTP contra nosotros mismos.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+from io import BytesIO
+from typing import Callable, Iterable, Optional
+from urllib.parse import urlsplit
+
+from PIL import Image
+
+# Formato PIL -> extension del archivo guardado
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+LOCAL_ROUTES = ('/download/', '/thumbnails/')
+LOOPBACK_HOSTS = {'localhost', '127.0.0.1', '0.0.0.0', '::1'}
+
+
+class ImageStore:
+    def __init__(self, directory: str, on_write: Optional[Callable[[str], None]] = None):
+        self.directory = directory
+        # Aviso con el nombre de cada imagen escrita o renovada (p. ej. para el indice de la galeria)
+        self.on_write = on_write
+        self._lock = threading.Lock()
+        self._stats = {'stored': 0, 'deduplicated': 0, 'bytes_stored': 0, 'local_reads': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, data: bytes, image_format: Optional[str]) -> str:
+        """Guarda los bytes originales y devuelve el nombre del archivo (estable para el mismo contenido)."""
+        extension = FORMAT_EXTENSIONS.get(image_format or '', '.jpg')
+        filename = f'{hashlib.sha256(data).hexdigest()[:32]}{extension}'
+        path = self.path(filename)
+        if os.path.exists(path):
+            # Ya estaba: solo actualizar la fecha para que vuelva a ser la mas reciente de la galeria
+            os.utime(path)
+            with self._lock:
+                self._stats['deduplicated'] += 1
+            self._notify(filename)
+            return filename
+
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._stats['stored'] += 1
+            self._stats['bytes_stored'] += len(data)
+        self._notify(filename)
+        return filename
+
+    def _notify(self, filename: str) -> None:
+        if self.on_write is not None:
+            self.on_write(filename)
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.directory, os.path.basename(filename))
+
+    def read(self, filename: str) -> bytes:
+        with open(self.path(filename), 'rb') as f:
+            data = f.read()
+        with self._lock:
+            self._stats['local_reads'] += 1
+        return data
+
+    def open_image(self, filename: str) -> Image.Image:
+        return Image.open(BytesIO(self.read(filename)))
+
+    @staticmethod
+    def mimetype(filename: str) -> str:
+        return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    def resolve_local(self, url: str, hosts: Iterable[str] = ()) -> Optional[str]:
+        """Nombre del archivo si `url` apunta a /download o /thumbnails de este servicio y existe; si no, None."""
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            return None
+        if parts.netloc not in hosts and parts.hostname not in LOOPBACK_HOSTS:
+            return None
+        for route in LOCAL_ROUTES:
+            if parts.path.startswith(route):
+                filename = os.path.basename(parts.path[len(route):])
+                if filename and os.path.isfile(self.path(filename)):
+                    return filename
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
@@ -0,0 +1,153 @@
+"""
+Indice en memoria de las imagenes de temp/, ordenado por fecha de modificacion.
+
+Se construye una vez al arrancar con os.scandir y despues se mantiene al dia:
+ImageStore avisa de cada imagen que escribe (touch) y un observador recoge los
+cambios de otros procesos. Con watchdog instalado se usan eventos del sistema
+(inotify en Linux); sin el, un hilo comprueba la fecha del directorio cada pocos
+segundos y solo vuelve a recorrerlo cuando ha cambiado. Las paginas
+(offset, limit) se sirven cortando la lista ya ordenada: O(limit) por peticion.
+"""
+import bisect
+import logging
+import os
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # opcional: sin watchdog se sondea el directorio
+    FileSystemEventHandler = object
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, index: 'MediaIndex'):
+        super().__init__()
+        self.index = index
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.index.touch(os.path.basename(event.src_path))
+
+    on_modified = on_created
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.index.discard(os.path.basename(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.index.discard(os.path.basename(event.src_path))
+            self.index.touch(os.path.basename(event.dest_path))
+
+
+class MediaIndex:
+    def __init__(self, directory: str, extensions: Iterable[str], poll_interval: float = 5.0):
+        self.directory = directory
+        self.extensions = {extension.lower() for extension in extensions}
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        # (-mtime, nombre): el orden natural de la lista es del mas reciente al mas antiguo
+        self._sorted: List[Tuple[float, str]] = []
+        self._observer = None
+        self._stop = threading.Event()
+        self._dir_mtime = None
+        self._stats = {'rebuilds': 0, 'updates': 0}
+        self.rebuild()
+
+    def _accepts(self, filename: str) -> bool:
+        return os.path.splitext(filename)[1].lower() in self.extensions
+
+    def rebuild(self) -> None:
+        """Recorre el directorio entero (al arrancar y cuando el sondeo detecta cambios externos)."""
+        mtimes = {}
+        try:
+            self._dir_mtime = os.stat(self.directory).st_mtime
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if self._accepts(entry.name) and entry.is_file():
+                        mtimes[entry.name] = entry.stat().st_mtime
+        except OSError as e:
+            logger.error(f'Error scanning {self.directory} for media: {e}')
+            return
+        with self._lock:
+            self._mtimes = mtimes
+            self._sorted = sorted((-mtime, name) for name, mtime in mtimes.items())
+            self._stats['rebuilds'] += 1
+
+    def touch(self, filename: str, mtime: Optional[float] = None) -> None:
+        """Anade o mueve `filename` a su nueva fecha (la del archivo si no se indica)."""
+        if not self._accepts(filename):
+            return
+        if mtime is None:
+            try:
+                mtime = os.path.getmtime(os.path.join(self.directory, filename))
+            except OSError:
+                self.discard(filename)
+                return
+        with self._lock:
+            self._remove(filename)
+            self._mtimes[filename] = mtime
+            bisect.insort(self._sorted, (-mtime, filename))
+            self._stats['updates'] += 1
+
+    def discard(self, filename: str) -> None:
+        with self._lock:
+            self._remove(filename)
+
+    def _remove(self, filename: str) -> None:
+        mtime = self._mtimes.pop(filename, None)
+        if mtime is None:
+            return
+        position = bisect.bisect_left(self._sorted, (-mtime, filename))
+        if position < len(self._sorted) and self._sorted[position] == (-mtime, filename):
+            del self._sorted[position]
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """(nombre, mtime) del mas reciente al mas antiguo, desde `offset` y como mucho `limit`."""
+        end = None if limit is None else offset + limit
+        with self._lock:
+            return [(name, -negative_mtime) for negative_mtime, name in self._sorted[offset:end]]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sorted)
+
+    def start(self) -> None:
+        """Empieza a seguir los cambios de otros procesos (watchdog o sondeo)."""
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_Handler(self), self.directory, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+            return
+        threading.Thread(target=self._poll, name='media-index-poll', daemon=True).start()
+
+    def _poll(self) -> None:
+        # Crear, borrar o renombrar un archivo cambia la fecha del directorio
+        while not self._stop.wait(self.poll_interval):
+            try:
+                changed = os.stat(self.directory).st_mtime != self._dir_mtime
+            except OSError:
+                continue
+            if changed:
+                self.rebuild()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'files': len(self._sorted),
+                'watcher': 'watchdog' if self._observer is not None else 'poll',
+                **self._stats,
+            }
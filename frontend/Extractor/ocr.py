@@ -0,0 +1,184 @@
+"""
+OCR con Tesseract y cache persistente de resultados.
+
+La cache es direccionada por contenido: la clave es un hash de los pixeles ya
+decodificados (no de los bytes del archivo, que cambian al recomprimir) junto con
+el idioma, la configuracion de Tesseract y su version. Cada resultado se guarda
+en disco como <clave>.txt y el tamano total se limita expulsando lo menos usado.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import pytesseract
+
+from preprocess import options_signature, preprocess_image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANG = 'spa+eng'
+
+
+def image_digest(img) -> str:
+    """Hash de los pixeles decodificados (modo, tamano y bytes crudos)."""
+    digest = hashlib.sha256()
+    digest.update(f'{img.mode}:{img.width}x{img.height}:'.encode('ascii'))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+_tesseract_version = None
+
+
+def _tesseract_version_tag() -> str:
+    global _tesseract_version
+    if _tesseract_version is None:
+        try:
+            _tesseract_version = str(pytesseract.get_tesseract_version())
+        except Exception:
+            # Sin Tesseract no habra OCR que cachear; no fijar la version para reintentar luego
+            return 'unknown'
+    return _tesseract_version
+
+
+class OcrCache:
+    """Cache LRU en disco de textos OCR, acotada por tamano total en bytes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # clave -> (bytes en disco, ultimo acceso); se reconstruye desde el directorio al arrancar
+        self._index = {}
+        self._total_bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'pixel_bytes_saved': 0}
+        self._ocr_runs = 0
+        self._ocr_seconds = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.txt'):
+                stat = entry.stat()
+                self._index[entry.name[:-4]] = (stat.st_size, stat.st_atime)
+                self._total_bytes += stat.st_size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.txt')
+
+    @staticmethod
+    def make_key(digest: str, lang: str, config: str, preprocess: str = '') -> str:
+        raw = f'{digest}|{lang}|{config}|{preprocess}|{_tesseract_version_tag()}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, pixel_bytes: int = 0):
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                if self._index.pop(key, None) is not None:
+                    self._total_bytes -= entry[0]
+                self._stats['misses'] += 1
+            return None
+        with self._lock:
+            self._index[key] = (entry[0], time.time())
+            self._stats['hits'] += 1
+            self._stats['pixel_bytes_saved'] += pixel_bytes
+        return text
+
+    def put(self, key: str, text: str, ocr_seconds: float = 0.0) -> None:
+        data = text.encode('utf-8')
+        tmp_path = f'{self._path(key)}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            previous = self._index.get(key)
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._index[key] = (len(data), time.time())
+            self._total_bytes += len(data)
+            # Coste medio de un OCR, para estimar el tiempo ahorrado por los aciertos
+            self._ocr_runs += 1
+            self._ocr_seconds += ocr_seconds
+            victims = self._pick_victims()
+        for victim in victims:
+            try:
+                os.remove(self._path(victim))
+            except FileNotFoundError:
+                pass
+
+    def _pick_victims(self):
+        if self._total_bytes <= self.max_bytes:
+            return []
+        victims = []
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            del self._index[key]
+            self._total_bytes -= size
+            self._stats['evictions'] += 1
+            victims.append(key)
+        return victims
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else None,
+                'evictions': self._stats['evictions'],
+                'pixel_bytes_saved': self._stats['pixel_bytes_saved'],
+                'avg_ocr_seconds': round(self._ocr_seconds / self._ocr_runs, 3) if self._ocr_runs else None,
+                'estimated_seconds_saved': (
+                    round(self._stats['hits'] * self._ocr_seconds / self._ocr_runs, 1) if self._ocr_runs else None
+                ),
+            }
+
+
+def tesseract_worker(img, lang=DEFAULT_LANG, config='', preprocess=None, tesseract_cmd=None):
+    """Preprocesa y ejecuta Tesseract sobre una imagen PIL; es picklable para poder correr en un ProcessPoolExecutor."""
+    if tesseract_cmd:
+        # Los procesos hijos no siempre heredan la ruta configurada en app.py
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    if preprocess:
+        img = preprocess_image(img, preprocess)
+    return pytesseract.image_to_string(img, lang=lang, config=config)
+
+
+def extract_text(img, cache=None, lang=DEFAULT_LANG, config='', run_ocr=None, preprocess=None, digest=None):
+    """OCR de una imagen PIL; si hay cache y los pixeles ya se procesaron, no se invoca Tesseract.
+
+    preprocess son las opciones de preprocess.preprocess_image (forman parte de la clave de cache).
+    digest evita recalcular image_digest(img) si quien llama ya lo tiene.
+    run_ocr(img, lang, config, preprocess) permite ejecutar Tesseract en otro sitio (p. ej. un pool de procesos).
+    """
+    # Convert to RGB if needed (required by pytesseract)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    key = None
+    if cache is not None:
+        key = cache.make_key(digest or image_digest(img), lang, config, options_signature(preprocess or {}))
+        text = cache.get(key, pixel_bytes=img.width * img.height * 3)
+        if text is not None:
+            return text
+
+    started = time.monotonic()
+    text = (run_ocr or tesseract_worker)(img, lang, config, preprocess)
+    if cache is not None:
+        cache.put(key, text, ocr_seconds=time.monotonic() - started)
+    return text
@@ -0,0 +1,240 @@
+"""
+Cola de trabajos OCR asincronos.
+
+Un POST crea un trabajo y devuelve su id sin esperar a Tesseract; el cliente
+consulta (o espera con long-poll) GET /jobs/<id>. Cada trabajo lo orquesta un
+hilo de despacho (descarga, decodificacion y consulta a la cache OCR) y el OCR
+en si corre en un ProcessPoolExecutor con tantos procesos como nucleos. Hay un
+hilo por proceso, asi que el resto de trabajos esperan en la cola de despacho,
+cuya profundidad esta acotada por `max_pending` (mas alla se lanza JobQueueFull).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import pytesseract
+
+from ocr import DEFAULT_LANG, extract_text, image_digest, tesseract_worker
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Hay demasiados trabajos pendientes; el cliente debe reintentar mas tarde."""
+
+
+class OcrJob:
+    def __init__(self, load_image: Callable, on_text: Optional[Callable], lang: str, config: str,
+                 preprocess: Optional[dict] = None):
+        self.id = uuid.uuid4().hex
+        self.load_image = load_image
+        self.on_text = on_text
+        self.lang = lang
+        self.config = config
+        self.preprocess = preprocess
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.ocr_seconds = None
+        self.cached = None
+        self.image_hash = None
+        self.saved = None
+        self.text = None
+        self.error = None
+        self.cancel_requested = False
+        self._dispatch_future = None
+        self._ocr_future = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def as_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queued_seconds': round((self.started_at or end) - self.created_at, 3),
+            'run_seconds': round(end - self.started_at, 3) if self.started_at else None,
+            'ocr_seconds': round(self.ocr_seconds, 3) if self.ocr_seconds is not None else None,
+            'cached': self.cached,
+            'image_hash': self.image_hash,
+            'preprocess': self.preprocess,
+            'text': self.text,
+            'saved': self.saved,
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+        }
+
+
+class OcrJobQueue:
+    def __init__(self, cache=None, workers: Optional[int] = None, max_pending: int = 32, result_ttl: float = 600.0):
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        # spawn en vez de fork: hacer fork desde un servidor con hilos puede dejar procesos
+        # colgados con locks heredados. Los procesos se crean bajo demanda en el primer submit.
+        # Cada uno vuelve a ejecutar el script principal como __mp_main__: app.py no arranca
+        # sus servicios en ese caso (ver init_services).
+        self._processes = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+        )
+        self._dispatch = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr-job')
+        self._cond = threading.Condition()
+        self._jobs: Dict[str, OcrJob] = {}
+        self._pending = 0
+        self._stats = {'submitted': 0, 'done': 0, 'failed': 0, 'cancelled': 0, 'rejected': 0}
+        self._run_seconds = 0.0
+
+    def submit(self, load_image: Callable, on_text: Optional[Callable] = None,
+               lang: str = DEFAULT_LANG, config: str = '', preprocess: Optional[dict] = None) -> OcrJob:
+        """Encola un trabajo; load_image() se llama ya en el hilo de despacho.
+
+        on_text(texto, image_hash) se llama solo si hay texto; image_hash es el hash de los pixeles.
+        Lo que devuelva (p. ej. si se guardo o era duplicado) queda en el campo 'saved' del trabajo.
+        """
+        with self._cond:
+            self._purge_expired()
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise JobQueueFull('La cola de OCR esta llena')
+            job = OcrJob(load_image, on_text, lang, config, preprocess)
+            self._jobs[job.id] = job
+            self._pending += 1
+            self._stats['submitted'] += 1
+            job._dispatch_future = self._dispatch.submit(self._run, job)
+        return job
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _run_ocr_in_process(self, job: OcrJob):
+        def run_ocr(img, lang, config, preprocess):
+            with self._cond:
+                if job.cancel_requested:
+                    raise CancelledError()
+                job.cached = False
+                job._ocr_future = self._processes.submit(
+                    tesseract_worker, img, lang, config, preprocess, pytesseract.pytesseract.tesseract_cmd
+                )
+            return job._ocr_future.result()
+        return run_ocr
+
+    def _run(self, job: OcrJob) -> None:
+        with self._cond:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.cached = self.cache is not None
+
+        try:
+            img = job.load_image()
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            job.image_hash = image_digest(img)
+            started = time.monotonic()
+            text = extract_text(img, cache=self.cache, lang=job.lang, config=job.config,
+                                run_ocr=self._run_ocr_in_process(job), preprocess=job.preprocess,
+                                digest=job.image_hash)
+            job.ocr_seconds = time.monotonic() - started
+            text = text.strip()
+            if job.cancel_requested:
+                raise CancelledError()
+            if text and job.on_text:
+                job.saved = job.on_text(text, job.image_hash)
+            self._finish(job, DONE, text=text)
+        except CancelledError:
+            self._finish(job, CANCELLED)
+        except Exception as exc:
+            logger.error(f'Trabajo OCR {job.id} fallido: {exc}', exc_info=True)
+            self._finish(job, FAILED, error=str(exc))
+
+    def _finish(self, job: OcrJob, status: str, text: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._cond:
+            if job.finished:
+                return
+            job.status = status
+            job.text = text
+            job.error = error
+            job.finished_at = time.time()
+            # Liberar la imagen y los callbacks cuanto antes
+            job.load_image = job.on_text = None
+            job._dispatch_future = job._ocr_future = None
+            self._pending -= 1
+            self._stats[status] += 1
+            if job.started_at:
+                self._run_seconds += job.finished_at - job.started_at
+            self._cond.notify_all()
+
+    def get(self, job_id: str) -> Optional[OcrJob]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[OcrJob]:
+        """Long-poll: espera hasta `timeout` segundos a que el trabajo termine."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and timeout > 0:
+                self._cond.wait_for(lambda: job.finished, timeout)
+            return job
+
+    def wait_any(self, jobs, timeout: Optional[float] = None) -> list:
+        """Espera a que termine al menos uno de `jobs` (o venza `timeout`) y devuelve los terminados."""
+        with self._cond:
+            self._cond.wait_for(lambda: any(job.finished for job in jobs), timeout)
+            return [job for job in jobs if job.finished]
+
+    def cancel(self, job_id: str) -> Optional[OcrJob]:
+        """Cancela un trabajo en cola al instante; si ya corre, su resultado se descarta al terminar."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_requested = True
+            dispatch, ocr = job._dispatch_future, job._ocr_future
+        if dispatch is not None and dispatch.cancel():
+            self._finish(job, CANCELLED)
+        elif ocr is not None:
+            # Solo tiene efecto si el proceso aun no tomo la imagen; Tesseract no se interrumpe
+            ocr.cancel()
+        return job
+
+    def stats(self) -> dict:
+        with self._cond:
+            statuses = [job.status for job in self._jobs.values()]
+            finished = self._stats['done'] + self._stats['failed'] + self._stats['cancelled']
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queued': statuses.count(QUEUED),
+                'running': statuses.count(RUNNING),
+                'retained': len(statuses),
+                **self._stats,
+                'avg_run_seconds': round(self._run_seconds / finished, 3) if finished else None,
+            }
+
+    def close(self) -> None:
+        self._dispatch.shutdown(wait=False, cancel_futures=True)
+        self._processes.shutdown(wait=False, cancel_futures=True)
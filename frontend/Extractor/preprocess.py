@@ -0,0 +1,192 @@
+"""
+Preprocesado de imagenes con OpenCV/NumPy antes de Tesseract.
+
+Las imagenes de Instagram suelen ser de 1080x1350 con grandes zonas sin texto;
+pasarlas tal cual a Tesseract es lento. Las etapas (todas opcionales) son:
+
+- grayscale: un solo canal en vez de RGB.
+- target_dpi / max_side: reduccion de escala (nunca se amplia). target_dpi
+  compara con el DPI que declara la imagen (72 si no declara ninguno), asi que
+  solo reduce las que declaran mas, como escaneos a 300 DPI; las de Instagram
+  (72 DPI) las reduce max_side.
+- crop_text: deteccion de bloques de texto (gradiente morfologico + dilatacion)
+  y recorte al rectangulo que los contiene.
+- threshold: umbral adaptativo (texto negro sobre fondo blanco).
+
+Las opciones se expresan como un dict; PRESETS define los conjuntos habituales
+y resolve_options() combina un preset con los cambios que lleguen en la peticion.
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+DEFAULT_SOURCE_DPI = 72
+
+PRESETS = {
+    'none': {},
+    'fast': {'grayscale': True, 'target_dpi': 150, 'max_side': 1280},
+    'full': {
+        'grayscale': True,
+        'target_dpi': 150,
+        'max_side': 1280,
+        'crop_text': True,
+        'threshold': True,
+    },
+}
+OPTION_TYPES = {
+    'grayscale': bool,
+    'threshold': bool,
+    'crop_text': bool,
+    'target_dpi': int,
+    'max_side': int,
+    'block_size': int,
+    'threshold_c': int,
+    'crop_margin': int,
+}
+# Valor minimo de las opciones enteras (threshold_c puede ser cualquier entero)
+OPTION_MINIMUMS = {'target_dpi': 1, 'max_side': 1, 'block_size': 1, 'crop_margin': 0}
+TRUE_STRINGS = ('true', '1', 'yes', 'si', 'on')
+FALSE_STRINGS = ('false', '0', 'no', 'off', '')
+DEFAULT_BLOCK_SIZE = 31
+DEFAULT_THRESHOLD_C = 15
+DEFAULT_CROP_MARGIN = 12
+# Fraccion minima del area que debe quedar fuera para que merezca la pena recortar
+MIN_CROP_SAVING = 0.1
+
+
+def resolve_options(value, default_preset='none') -> dict:
+    """Convierte lo recibido (None, nombre de preset, bool o dict con 'preset' y overrides) en opciones validadas."""
+    if value is None:
+        value = default_preset
+    if value is False:
+        value = 'none'
+    if value is True:
+        value = 'full'
+    if isinstance(value, str):
+        value = {'preset': value}
+    if not isinstance(value, dict):
+        raise ValueError('preprocess debe ser un preset, un booleano o un objeto')
+
+    preset = value.get('preset', default_preset)
+    if not isinstance(preset, str) or preset not in PRESETS:
+        raise ValueError(f'Preset de preprocesado desconocido: {preset}')
+    options = dict(PRESETS[preset])
+    for name, raw in value.items():
+        if name == 'preset':
+            continue
+        if name not in OPTION_TYPES:
+            raise ValueError(f'Opcion de preprocesado desconocida: {name}')
+        parsed = _parse_option(name, raw)
+        if parsed is None or parsed is False:
+            options.pop(name, None)
+        else:
+            options[name] = parsed
+    return options
+
+
+def _parse_option(name: str, raw):
+    """Valida el valor de una opcion; ValueError (un 400 para la API) si no es valido."""
+    if raw is None:
+        return None
+    if OPTION_TYPES[name] is bool:
+        # bool('false') es True: los textos se interpretan explicitamente
+        if isinstance(raw, bool):
+            return raw
+        if isinstance(raw, int) and raw in (0, 1):
+            return bool(raw)
+        if isinstance(raw, str) and raw.strip().lower() in TRUE_STRINGS + FALSE_STRINGS:
+            return raw.strip().lower() in TRUE_STRINGS
+        raise ValueError(f'{name} debe ser true o false')
+
+    if raw is False:
+        return None
+    if isinstance(raw, bool) or not isinstance(raw, (int, float, str)):
+        raise ValueError(f'{name} debe ser un numero entero')
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} debe ser un numero entero')
+    minimum = OPTION_MINIMUMS.get(name)
+    if minimum is not None and value < minimum:
+        raise ValueError(f'{name} debe ser mayor o igual que {minimum}')
+    return value
+
+
+def options_signature(options: dict) -> str:
+    """Representacion estable de las opciones, para incluirla en la clave de la cache OCR."""
+    return ','.join(f'{name}={options[name]}' for name in sorted(options))
+
+
+def _scale_factor(img: Image.Image, width: int, height: int, options: dict) -> float:
+    scale = 1.0
+    target_dpi = options.get('target_dpi')
+    if target_dpi:
+        source_dpi = img.info.get('dpi', (DEFAULT_SOURCE_DPI,))[0] or DEFAULT_SOURCE_DPI
+        scale = min(scale, target_dpi / float(source_dpi))
+    max_side = options.get('max_side')
+    if max_side:
+        scale = min(scale, max_side / float(max(width, height)))
+    return scale
+
+
+def text_regions(gray: np.ndarray) -> list:
+    """Rectangulos (x, y, w, h) de bloques candidatos a contener texto."""
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, kernel)
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Unir letras en palabras y lineas
+    joined = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3)))
+    contours, _ = cv2.findContours(joined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < 8 or w < 8:
+            continue
+        # Los bloques de texto tienen una densidad de trazo intermedia
+        density = cv2.countNonZero(binary[y:y + h, x:x + w]) / float(w * h)
+        if 0.1 <= density <= 0.9:
+            regions.append((x, y, w, h))
+    return regions
+
+
+def _crop_to_text(gray: np.ndarray, margin: int) -> np.ndarray:
+    regions = text_regions(gray)
+    if not regions:
+        return gray
+    height, width = gray.shape[:2]
+    x0 = max(min(x for x, _, _, _ in regions) - margin, 0)
+    y0 = max(min(y for _, y, _, _ in regions) - margin, 0)
+    x1 = min(max(x + w for x, _, w, _ in regions) + margin, width)
+    y1 = min(max(y + h for _, y, _, h in regions) + margin, height)
+    if (x1 - x0) * (y1 - y0) > (1 - MIN_CROP_SAVING) * width * height:
+        return gray
+    return gray[y0:y1, x0:x1]
+
+
+def preprocess_image(img: Image.Image, options: dict) -> Image.Image:
+    """Aplica las etapas indicadas en options y devuelve una imagen PIL lista para Tesseract."""
+    if not options:
+        return img
+
+    rgb = np.asarray(img.convert('RGB'))
+    height, width = rgb.shape[:2]
+    scale = _scale_factor(img, width, height, options)
+    if scale < 1.0:
+        size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
+
+    needs_gray = options.get('grayscale') or options.get('crop_text') or options.get('threshold')
+    if not needs_gray:
+        return Image.fromarray(rgb)
+
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    if options.get('crop_text'):
+        gray = _crop_to_text(gray, options.get('crop_margin', DEFAULT_CROP_MARGIN))
+    if options.get('threshold'):
+        block_size = options.get('block_size', DEFAULT_BLOCK_SIZE) | 1  # debe ser impar
+        gray = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+            max(block_size, 3), options.get('threshold_c', DEFAULT_THRESHOLD_C),
+        )
+    return Image.fromarray(gray)
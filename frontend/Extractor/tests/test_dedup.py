@@ -0,0 +1,69 @@
+"""
+El indice de casi duplicados solo compara cada texto con los candidatos de sus
+tablas. Estas pruebas sustituyen el SimHash por un hash uniforme para controlar
+las huellas y comprueban que los candidatos no crecen con el corpus y que no se
+pierde ningun texto a max_distance bits.
+"""
+import hashlib
+import os
+import random
+import sys
+
+import pytest
+
+EXTRACTOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXTRACTOR_DIR)
+
+import dedup  # noqa: E402
+from dedup import DedupIndex  # noqa: E402
+
+FINGERPRINTS = {}
+
+
+def _text(number):
+    return f'texto de prueba numero {number} con longitud suficiente'
+
+
+@pytest.fixture
+def uniform_simhash(monkeypatch):
+    # Huella = blake2b del texto, o la fijada en FINGERPRINTS para construir casos concretos
+    def fake_simhash(normalized):
+        if normalized in FINGERPRINTS:
+            return FINGERPRINTS[normalized]
+        return int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    monkeypatch.setattr(dedup, 'simhash', fake_simhash)
+    yield
+    FINGERPRINTS.clear()
+
+
+def _average_candidates(size, queries=500):
+    index = DedupIndex(max_distance=6)
+    for number in range(size):
+        index.add(_text(number), number)
+    for number in range(size, size + queries):
+        assert index.find(_text(number)) is None
+    return index.stats()['candidates'] / queries
+
+
+def test_candidates_stay_bounded_as_corpus_grows(uniform_simhash):
+    tables = len(dedup.table_masks(6))
+    for size in (1_000, 10_000, 40_000):
+        average = _average_candidates(size)
+        # Con claves de KEY_BITS bits se esperan ~tables * size / 2**KEY_BITS candidatos (4 con 10k)
+        expected = tables * size / 2 ** dedup.KEY_BITS
+        assert average <= 3 * expected + 1, (size, average)
+        assert average < size / 500, (size, average)
+
+
+@pytest.mark.parametrize('max_distance', range(dedup.MAX_DISTANCE_LIMIT + 1))
+def test_finds_every_fingerprint_within_max_distance(uniform_simhash, max_distance):
+    rng = random.Random(max_distance)
+    index = DedupIndex(max_distance=max_distance)
+    for number in range(200):
+        original = rng.getrandbits(dedup.SIMHASH_BITS)
+        flipped = sum(1 << bit for bit in rng.sample(range(dedup.SIMHASH_BITS), max_distance))
+        FINGERPRINTS[dedup.normalize(_text(number))] = original
+        FINGERPRINTS[dedup.normalize(_text(number) + ' bis')] = original ^ flipped
+        index.add(_text(number), number)
+        assert index.find(_text(number) + ' bis') == number
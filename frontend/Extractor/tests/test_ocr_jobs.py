@@ -0,0 +1,54 @@
+"""
+Los procesos OCR se crean con spawn y cada uno vuelve a ejecutar el script principal
+(python app.py) como __mp_main__. Estas pruebas arrancan un proceso asi y comprueban
+que no levanta ninguno de los servicios del servidor.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+EXTRACTOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(EXTRACTOR_DIR, 'app.py')
+SERVICES = (
+    'media_index', 'image_store', 'ocr_cache', 'thumbnail_cache', 'ocr_jobs',
+    'corpus', 'text_mirror', 'dedup_index', 'analysis_cache', 'browser_pool',
+)
+
+
+def _worker_state():
+    main = sys.modules['__mp_main__']
+    return {
+        'main_file': main.__file__,
+        'services': {name: getattr(main, name) for name in SERVICES},
+        'threads': [thread.name for thread in threading.enumerate()],
+    }
+
+
+def test_spawn_worker_does_not_start_app_services(tmp_path, monkeypatch):
+    paths = {
+        'OCR_CACHE_DIR': tmp_path / 'ocr',
+        'THUMBNAIL_CACHE_DIR': tmp_path / 'thumbnails',
+        'CORPUS_DB_PATH': tmp_path / 'corpus.db',
+    }
+    for name, path in paths.items():
+        monkeypatch.setenv(name, str(path))
+    monkeypatch.syspath_prepend(EXTRACTOR_DIR)
+    monkeypatch.syspath_prepend(os.path.dirname(os.path.abspath(__file__)))
+    # Lo que ve spawn cuando el servidor se lanza con "python app.py"
+    fake_main = types.ModuleType('__main__')
+    fake_main.__file__ = APP_PATH
+    fake_main.__spec__ = None
+    monkeypatch.setitem(sys.modules, '__main__', fake_main)
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        state = pool.submit(_worker_state).result(timeout=120)
+
+    assert os.path.samefile(state['main_file'], APP_PATH)
+    assert state['services'] == {name: None for name in SERVICES}
+    # Ni el observador de temp/ ni hilos de sondeo, navegadores o colas
+    assert state['threads'] == ['MainThread']
+    for path in paths.values():
+        assert not path.exists()
@@ -0,0 +1,181 @@
+"""
+Copia en texto plano del corpus (extracted_texts.txt) con rotacion e indice de offsets.
+
+El archivo activo crece solo hasta `max_bytes` o `max_age` segundos; despues se
+compacta en un segmento .txt.gz dentro de <archivo>.segments/ y se empieza uno
+nuevo, de modo que los scripts legacy que leen el archivo entero solo leen lo
+reciente. Cada segmento se escribe como un miembro gzip por entrada: sigue siendo
+un .gz normal (zcat funciona) y permite descomprimir solo las entradas pedidas.
+
+Cada archivo tiene al lado un indice .idx con un registro de tamano fijo por
+entrada (offset del bloque, timestamp). Con el, la rotacion corta el archivo en
+entradas sin volver a analizarlo y el numero de entradas sale del tamano del
+indice. Las lecturas por fecha o por origen las sirve el corpus SQLite, que es la
+fuente de verdad; esta copia es solo para los scripts legacy.
+
+Uso desde la linea de comandos:
+
+    python text_mirror.py rotate gemini/extracted_texts.txt
+"""
+import argparse
+import gzip
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from corpus import LEGACY_HEADER_RE, TIMESTAMP_FORMAT, format_entry
+
+RECORD = struct.Struct('<Qd')  # offset del bloque, timestamp
+FILE_HEADER = 'Archivo de textos extraídos\n' + '=' * 30 + '\n\n'
+SEGMENT_RE = re.compile(r'-\d{6}-\d{8}-\d{6}\.txt\.gz$')
+
+
+class _Index:
+    """Indice .idx: registros RECORD leidos con seek, sin cargar el archivo entero."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self.path) // RECORD.size
+        except OSError:
+            return 0
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> List[Tuple[int, float]]:
+        stop = len(self) if stop is None else stop
+        if start >= stop:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(start * RECORD.size)
+            data = f.read((stop - start) * RECORD.size)
+        return [RECORD.unpack_from(data, i) for i in range(0, len(data) - RECORD.size + 1, RECORD.size)]
+
+    def append(self, records: Iterable[Tuple[int, float]]) -> None:
+        with open(self.path, 'ab') as f:
+            f.write(b''.join(RECORD.pack(offset, timestamp) for offset, timestamp in records))
+
+
+class TextMirror:
+    def __init__(self, path: str, max_bytes: int = 5 * 1024 * 1024, max_age: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segments_dir = f'{os.path.splitext(path)[0]}.segments'
+        self.index = _Index(f'{path}.idx')
+        self._lock = threading.Lock()
+        os.makedirs(self.segments_dir, exist_ok=True)
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(FILE_HEADER)
+        records = self.index.read(len(self.index) - 1) if len(self.index) else []
+        if not os.path.exists(self.index.path) or (records and records[-1][0] >= os.path.getsize(path)):
+            self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        """Reconstruye el .idx del archivo activo recorriendolo una vez (archivos previos o editados a mano)."""
+        records, offset = [], 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                match = LEGACY_HEADER_RE.match(line.decode('utf-8', errors='replace').rstrip('\n'))
+                if match:
+                    records.append((offset, datetime.strptime(match.group(1), TIMESTAMP_FORMAT).timestamp()))
+                offset += len(line)
+        tmp_path = f'{self.index.path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(RECORD.pack(*record) for record in records))
+        os.replace(tmp_path, self.index.path)
+
+    def append(self, entries: Iterable[Tuple[float, str]]) -> None:
+        """Anade entradas (created_at, texto) en una sola escritura; rota antes si toca."""
+        with self._lock:
+            if self._should_rotate():
+                self._rotate()
+            offset = os.path.getsize(self.path)
+            chunks, records = [], []
+            for created_at, text in entries:
+                block = format_entry(created_at, text).encode('utf-8')
+                header_at = block.index(b'---')
+                records.append((offset + header_at, created_at))
+                chunks.append(block)
+                offset += len(block)
+            if not chunks:
+                return
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(chunks))
+            # El indice se escribe despues de los datos: nunca apunta a bytes que no existen
+            self.index.append(records)
+
+    def _should_rotate(self) -> bool:
+        if not len(self.index):
+            return False
+        if os.path.getsize(self.path) >= self.max_bytes:
+            return True
+        return self.max_age is not None and time.time() - self.index.read(0, 1)[0][1] >= self.max_age
+
+    def rotate(self) -> Optional[str]:
+        with self._lock:
+            return self._rotate() if len(self.index) else None
+
+    def _rotate(self) -> str:
+        """Compacta el archivo activo en un segmento .txt.gz (un miembro gzip por entrada) con su .idx."""
+        records = self.index.read()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        # Numero de secuencia delante de la fecha de la primera entrada: el orden alfabetico es el cronologico
+        stamp = datetime.fromtimestamp(records[0][1]).strftime('%Y%m%d-%H%M%S')
+        name = os.path.basename(os.path.splitext(self.path)[0])
+        segment_path = os.path.join(self.segments_dir, f'{name}-{len(self._segments()) + 1:06d}-{stamp}.txt.gz')
+
+        members, segment_records, offset = [], [], 0
+        for position, (start, created_at) in enumerate(records):
+            end = records[position + 1][0] if position + 1 < len(records) else len(data)
+            member = gzip.compress(data[start:end], mtime=0)
+            segment_records.append((offset, created_at))
+            members.append(member)
+            offset += len(member)
+        with open(f'{segment_path}.tmp', 'wb') as f:
+            f.write(b''.join(members))
+        with open(f'{segment_path}.idx', 'wb') as f:
+            f.write(b''.join(RECORD.pack(*record) for record in segment_records))
+        os.replace(f'{segment_path}.tmp', segment_path)
+
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(FILE_HEADER)
+        with open(self.index.path, 'wb'):
+            pass
+        return segment_path
+
+    def _segments(self) -> List[str]:
+        names = sorted(name for name in os.listdir(self.segments_dir) if SEGMENT_RE.search(name))
+        return [os.path.join(self.segments_dir, name) for name in names]
+
+    def stats(self) -> dict:
+        """Contadores a partir del tamano de los archivos e indices, sin leer su contenido."""
+        segments = self._segments()
+        active = len(self.index)
+        return {
+            'entries': active + sum(len(_Index(f'{path}.idx')) for path in segments),
+            'active_entries': active,
+            'active_bytes': os.path.getsize(self.path),
+            'segments': len(segments),
+            'segment_bytes': sum(os.path.getsize(path) for path in segments),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rotacion de la copia de texto del corpus')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rotate = subparsers.add_parser('rotate', help='Compacta el archivo activo en un segmento')
+    rotate.add_argument('text_file')
+    args = parser.parse_args()
+
+    print(TextMirror(args.text_file).rotate() or 'Nada que rotar')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Miniaturas redimensionadas de las imagenes de temp/, generadas al pedirlas por primera vez.
+
+Cada variante (anchura de WIDTHS y formato WebP o JPEG) se guarda en una cache
+LRU en disco acotada por tamano total. Su clave depende del nombre, la fecha y el
+tamano de la original, asi que si la original cambia se genera otra variante y
+la clave sirve tambien de ETag. Las peticiones simultaneas de la misma variante
+esperan a que la primera la genere en lugar de redimensionar dos veces.
+"""
+import hashlib
+import os
+import threading
+import time
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+WIDTHS = (160, 320, 640)
+EXIF_ORIENTATION = 0x0112
+# formato pedido -> (formato PIL, extension, mimetype, opciones de guardado)
+FORMATS = {
+    'webp': ('WEBP', '.webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', '.jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def pick_width(requested: int) -> int:
+    """Anchura estandar mas pequena que cubre la pedida (la mayor si ninguna llega)."""
+    for width in WIDTHS:
+        if width >= requested:
+            return width
+    return WIDTHS[-1]
+
+
+def negotiate_format(requested: Optional[str], accept: str) -> str:
+    """'webp' o 'jpeg': el pedido si es valido; si no, WebP cuando el navegador lo acepta."""
+    if requested in FORMATS:
+        return requested
+    return 'webp' if 'image/webp' in (accept or '') else 'jpeg'
+
+
+def render_variant(source_path: str, width: int, fmt: str) -> bytes:
+    pil_format, _, _, options = FORMATS[fmt]
+    with Image.open(source_path) as img:
+        stored_width, stored_height = img.size
+        # Girada 90 grados por EXIF: la anchura que se ve es la altura guardada
+        rotated = img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8)
+        shown_width, shown_height = (stored_height, stored_width) if rotated else (stored_width, stored_height)
+        if shown_width > width:
+            box = (width, max(round(shown_height * width / shown_width), 1))
+            # JPEG: decodificar ya a 1/2, 1/4 o 1/8 (sin bajar de `box`) es mucho mas rapido que decodificar y reducir
+            img.draft('RGB', box[::-1] if rotated else box)
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            img = img.resize((width, max(round(img.height * width / img.width), 1)), Image.LANCZOS)
+        # JPEG no admite transparencia; WebP la conserva (PNG/GIF con canal alfa o color transparente)
+        transparent = 'A' in img.getbands() or 'transparency' in img.info
+        target_mode = 'RGBA' if transparent and pil_format == 'WEBP' else 'RGB'
+        if img.mode != target_mode:
+            img = img.convert(target_mode)
+        buffer = BytesIO()
+        img.save(buffer, pil_format, **options)
+        return buffer.getvalue()
+
+
+class ThumbnailCache:
+    """Cache LRU en disco de variantes redimensionadas, acotada por tamano total en bytes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # clave + extension -> (bytes en disco, ultimo acceso); se reconstruye desde el directorio al arrancar
+        self._index = {}
+        self._total_bytes = 0
+        self._in_progress = {}
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'render_seconds': 0.0}
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                self._index[entry.name] = (stat.st_size, stat.st_atime)
+                self._total_bytes += stat.st_size
+
+    @staticmethod
+    def make_key(source_path: str, width: int, fmt: str) -> str:
+        stat = os.stat(source_path)
+        raw = f'{os.path.basename(source_path)}|{stat.st_mtime_ns}|{stat.st_size}|{width}|{fmt}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    def get(self, source_path: str, width: int, fmt: str) -> Tuple[str, str]:
+        """Ruta de la variante (generandola si hace falta) y su ETag."""
+        key = self.make_key(source_path, width, fmt)
+        name = f'{key}{FORMATS[fmt][1]}'
+        path = os.path.join(self.directory, name)
+        while True:
+            with self._lock:
+                entry = self._index.get(name)
+                if entry is not None and os.path.exists(path):
+                    self._index[name] = (entry[0], time.time())
+                    self._stats['hits'] += 1
+                    return path, key
+                event = self._in_progress.get(name)
+                if event is None:
+                    event = self._in_progress[name] = threading.Event()
+                    self._stats['misses'] += 1
+                    break
+            # Otra peticion esta generando la misma variante
+            event.wait()
+
+        try:
+            started = time.monotonic()
+            data = render_variant(source_path, width, fmt)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                previous = self._index.get(name)
+                if previous is not None:
+                    self._total_bytes -= previous[0]
+                self._index[name] = (len(data), time.time())
+                self._total_bytes += len(data)
+                self._stats['render_seconds'] += time.monotonic() - started
+                victims = self._pick_victims(keep=name)
+            for victim in victims:
+                try:
+                    os.remove(os.path.join(self.directory, victim))
+                except FileNotFoundError:
+                    pass
+            return path, key
+        finally:
+            with self._lock:
+                self._in_progress.pop(name).set()
+
+    def _pick_victims(self, keep: str):
+        if self._total_bytes <= self.max_bytes:
+            return []
+        victims = []
+        for name, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            del self._index[name]
+            self._total_bytes -= size
+            self._stats['evictions'] += 1
+            victims.append(name)
+        return victims
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else None,
+                'evictions': self._stats['evictions'],
+                'avg_render_seconds': (
+                    round(self._stats['render_seconds'] / self._stats['misses'], 4) if self._stats['misses'] else None
+                ),
+            }
@@ -0,0 +1,51 @@
+"""
+Benchmark de logins/segundo para cada coste del KDF.
+
+Simula lo que hace /api/login: verificar contrasenas en un pool de hilos del mismo
+tamano que PASSWORD_HASH_WORKERS. Ejemplo:
+
+    python scripts/bench_password_hashing.py --workers 4 --logins 200
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passwords import Pbkdf2Hasher, ScryptHasher, hash_password, verify_password
+
+COST_SETTINGS = [
+    ScryptHasher(n=2 ** 12),
+    ScryptHasher(n=2 ** 14),
+    ScryptHasher(n=2 ** 15),
+    ScryptHasher(n=2 ** 16),
+    Pbkdf2Hasher(iterations=100_000),
+    Pbkdf2Hasher(iterations=300_000),
+    Pbkdf2Hasher(iterations=600_000),
+]
+
+
+def bench(hasher, workers: int, logins: int) -> float:
+    stored = hash_password("contrasena-de-prueba", hasher=hasher)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda _: verify_password("contrasena-de-prueba", stored), range(logins)))
+        elapsed = time.perf_counter() - start
+    assert all(results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 4))))
+    parser.add_argument("--logins", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'esquema':<16}{'coste':<22}{'logins/s':>10}{'ms/login':>10}")
+    for hasher in COST_SETTINGS:
+        rate = bench(hasher, args.workers, args.logins)
+        cost = ",".join(f"{name}={value}" for name, value in hasher.params.items())
+        print(f"{hasher.scheme:<16}{cost:<22}{rate:>10.1f}{args.workers * 1000 / rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
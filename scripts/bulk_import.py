@@ -0,0 +1,244 @@
+"""
+Importacion masiva de usuarios compartida por scripts/insert_users.py y POST /api/users/bulk.
+
+Flujo: se leen filas CSV/NDJSON, se descartan las invalidas o repetidas dentro del
+propio archivo, las contrasenas se hashean en paralelo y todo se carga con COPY en
+una tabla temporal que se fusiona con users en un unico INSERT ... ON CONFLICT.
+
+Los pasos de la carga estan una sola vez, en load_steps(): load_users() los ejecuta
+con una conexion sincrona y la API con su pool asincrono.
+"""
+import csv
+import io
+import json
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Sequence
+
+HASH_CHUNK_SIZE = 1000
+# Acciones de load_steps(): ejecutar, COPY de filas, ejecutar y leer todas las filas o una
+EXECUTE, COPY, FETCH_ALL, FETCH_ONE = "execute", "copy", "fetchall", "fetchone"
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE users_import (
+        line INTEGER NOT NULL,
+        username VARCHAR(50) NOT NULL,
+        email VARCHAR(100) NOT NULL,
+        password_hash VARCHAR(255) NOT NULL
+    ) ON COMMIT DROP
+"""
+COPY_STAGING_SQL = "COPY users_import (line, username, email, password_hash) FROM STDIN"
+# El email pertenece a otro usuario: el merge fallaria por idx_users_email
+DROP_EMAIL_CONFLICTS_SQL = """
+    DELETE FROM users_import i USING users u
+    WHERE u.email = i.email AND u.username <> i.username
+    RETURNING i.line, i.username
+"""
+DROP_EXISTING_USERS_SQL = """
+    DELETE FROM users_import i USING users u
+    WHERE u.username = i.username
+    RETURNING i.line, i.username
+"""
+MERGE_SQL = """
+    WITH merged AS (
+        INSERT INTO users (username, email, password_hash)
+        SELECT username, email, password_hash FROM users_import ORDER BY line
+        ON CONFLICT (username) DO UPDATE SET
+            email = EXCLUDED.email,
+            password_hash = EXCLUDED.password_hash
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+    FROM merged
+"""
+
+
+@dataclass
+class ImportRow:
+    line: int
+    username: str
+    email: str
+    password: str
+
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    inserted: int = 0
+    updated: int = 0
+    conflicts: List[Dict] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+
+    def conflict(self, line: int, username: Optional[str], reason: str) -> None:
+        self.conflicts.append({"line": line, "username": username, "reason": reason})
+
+    def as_dict(self) -> Dict:
+        return {
+            "total": self.total,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": len(self.conflicts),
+            "conflicts": self.conflicts,
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 3),
+        }
+
+
+def _iter_records(data: str, fmt: str) -> Iterator[tuple]:
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(data))
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "ndjson":
+        for line_num, line in enumerate(data.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_num, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def parse_users(data: str, fmt: str, report: ImportReport) -> List[ImportRow]:
+    """
+    Convierte el contenido CSV (cabecera username,email,password) o NDJSON en filas validas.
+    Las filas invalidas y las repetidas dentro del archivo se anotan como conflicto;
+    ante un username o email repetido gana la ultima aparicion.
+    """
+    rows: Dict[str, ImportRow] = {}
+    emails: Dict[str, str] = {}
+    for line, record in _iter_records(data, fmt):
+        report.total += 1
+        if record is None:
+            report.conflict(line, None, "invalid_row")
+            continue
+        username = str(record.get("username") or "").strip()
+        email = str(record.get("email") or "").strip()
+        password = str(record.get("password") or "")
+        if not username or len(username) > 50 or not password:
+            report.conflict(line, username or None, "invalid_row")
+            continue
+        if len(email) > 100 or not EMAIL_RE.match(email):
+            report.conflict(line, username, "invalid_email")
+            continue
+
+        previous = rows.pop(username, None)
+        if previous is not None:
+            report.conflict(previous.line, username, "duplicate_username_in_input")
+            emails.pop(previous.email, None)
+        owner = emails.get(email)
+        if owner is not None:
+            replaced = rows.pop(owner)
+            report.conflict(replaced.line, owner, "duplicate_email_in_input")
+        rows[username] = ImportRow(line, username, email, password)
+        emails[email] = username
+
+    return sorted(rows.values(), key=lambda row: row.line)
+
+
+def hash_chunk(hash_fn: Callable[[str], str], passwords: Sequence[str]) -> List[str]:
+    return [hash_fn(password) for password in passwords]
+
+
+def chunked(items: Sequence, size: int = HASH_CHUNK_SIZE) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def hash_passwords(
+    rows: Sequence[ImportRow],
+    hash_fn: Callable[[str], str],
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+) -> List[str]:
+    """Hashea las contrasenas por bloques en un pool de procesos, conservando el orden."""
+    hashes: List[str] = []
+    passwords = [row.password for row in rows]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(partial(hash_chunk, hash_fn), chunked(passwords)):
+            hashes.extend(chunk)
+            if progress:
+                progress("hashed", len(hashes), len(passwords))
+    return hashes
+
+
+def staging_records(rows: Sequence[ImportRow], hashes: Sequence[str]) -> Iterable[tuple]:
+    return ((row.line, row.username, row.email, hashed) for row, hashed in zip(rows, hashes))
+
+
+def load_steps(
+    rows: Sequence[ImportRow],
+    hashes: Sequence[str],
+    update_existing: bool = True,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+) -> Generator[tuple, Any, tuple]:
+    """
+    Pasos de la carga como generador de (accion, sql, filas), sin depender de si el cursor es
+    sincrono o asincrono. Quien lo recorre ejecuta cada paso, devuelve con send() lo leido
+    (o None) y, cuando la transaccion se ha confirmado, pasa el valor final a record_load().
+    """
+    conflicts = []
+    yield EXECUTE, CREATE_STAGING_SQL, None
+    yield COPY, COPY_STAGING_SQL, staging_records(rows, hashes)
+    if progress:
+        progress("copied", len(rows), len(rows))
+    yield EXECUTE, "ANALYZE users_import", None
+
+    for line, username in (yield FETCH_ALL, DROP_EMAIL_CONFLICTS_SQL, None):
+        conflicts.append((line, username, "email_in_use"))
+    if not update_existing:
+        for line, username in (yield FETCH_ALL, DROP_EXISTING_USERS_SQL, None):
+            conflicts.append((line, username, "username_exists"))
+
+    inserted, updated = yield FETCH_ONE, MERGE_SQL, None
+    return conflicts, inserted, updated
+
+
+def record_load(report: ImportReport, result: tuple) -> ImportReport:
+    """
+    Anota en el informe el resultado de load_steps(). Se llama solo tras el commit: si la
+    transaccion falla a mitad y se reintenta, los conflictos no quedan repetidos.
+    """
+    conflicts, report.inserted, report.updated = result
+    for line, username, reason in conflicts:
+        report.conflict(line, username, reason)
+    return report
+
+
+def load_users(
+    conn,
+    rows: Sequence[ImportRow],
+    hashes: Sequence[str],
+    report: ImportReport,
+    update_existing: bool = True,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+) -> ImportReport:
+    """Carga las filas ya hasheadas con una conexion psycopg sincrona, en una sola transaccion."""
+    steps = load_steps(rows, hashes, update_existing, progress)
+    result = None
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            while True:
+                try:
+                    action, sql, records = steps.send(result)
+                except StopIteration as stop:
+                    loaded = stop.value
+                    break
+                if action == COPY:
+                    with cursor.copy(sql) as copy:
+                        for record in records:
+                            copy.write_row(record)
+                    result = None
+                else:
+                    cursor.execute(sql)
+                    result = cursor.fetchall() if action == FETCH_ALL else cursor.fetchone() if action == FETCH_ONE else None
+    record_load(report, loaded)
+    if progress:
+        progress("merged", report.inserted + report.updated, len(rows))
+    return report
@@ -1,8 +1,12 @@
-import hashlib
+import argparse
+import json
 import os
 import time
 
-import psycopg2
+import psycopg
+
+from bulk_import import ImportReport, ImportRow, hash_passwords, load_users, parse_users
+from passwords import hash_password
 
 # Configuración de la conexión a la base de datos
 DB_HOST = os.environ.get("DB_HOST", "db")
@@ -13,17 +17,46 @@ DB_PASS = os.environ.get("POSTGRES_PASSWORD", "password_auth")
 # Datos de usuarios a insertar (password en texto plano, se almacenará hasheado)
 USERS_TO_INSERT = [
     ("juan", "juan@example.com", "prueba123")
-    
+
 ]
 
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+def print_progress(stage: str, done: int, total: int):
+    print(f"[{stage}] {done}/{total}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inserta o actualiza usuarios en la base de datos.")
+    parser.add_argument("--file", help="Archivo CSV (username,email,password) o NDJSON con los usuarios")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="Formato del archivo (por defecto, segun la extension)")
+    parser.add_argument("--skip-existing", action="store_true", help="No actualizar usuarios que ya existen")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para el hashing (por defecto, todos los nucleos)")
+    return parser.parse_args()
+
+
+def read_rows(args, report: ImportReport):
+    if not args.file:
+        report.total = len(USERS_TO_INSERT)
+        return [
+            ImportRow(line, username, email, password)
+            for line, (username, email, password) in enumerate(USERS_TO_INSERT, start=1)
+        ]
+
+    fmt = args.format or ("ndjson" if args.file.endswith((".ndjson", ".jsonl")) else "csv")
+    with open(args.file, "r", encoding="utf-8") as f:
+        return parse_users(f.read(), fmt, report)
+
 
 def insert_users():
     """
-    Se conecta a la base de datos PostgreSQL e inserta usuarios.
+    Se conecta a la base de datos PostgreSQL e inserta usuarios con COPY + un único merge.
     """
+    args = parse_args()
+    report = ImportReport()
+    rows = read_rows(args, report)
+    print(f"{len(rows)} usuarios válidos de {report.total} leídos.")
+    hashes = hash_passwords(rows, hash_password, workers=args.workers, progress=print_progress)
+
     conn = None
     max_retries = 10
     retry_delay = 5  # segundos
@@ -32,36 +65,27 @@ def insert_users():
         try:
             print(f"Intentando conectar a la base de datos... Intento {attempt + 1}/{max_retries}")
             # Conexión a la base de datos
-            conn = psycopg2.connect(
+            conn = psycopg.connect(
                 host=DB_HOST,
-                database=DB_NAME,
+                dbname=DB_NAME,
                 user=DB_USER,
                 password=DB_PASS
             )
-            cursor = conn.cursor()
-
-            # Consulta SQL para la inserción
-            insert_query = """
-            INSERT INTO users (username, email, password_hash)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (username)
-            DO UPDATE SET
-                email = EXCLUDED.email,
-                password_hash = EXCLUDED.password_hash;
-            """
-
-            # Insertar cada usuario
-            for username, email, plain_password in USERS_TO_INSERT:
-                hashed_password = hash_password(plain_password)
-                cursor.execute(insert_query, (username, email, hashed_password))
-                print(f"Usuario '{username}' insertado/actualizado.")
-
-            # Confirmar la transacción
-            conn.commit()
+
+            # load_users solo anota los conflictos tras el commit: un reintento no los repite
+            load_users(
+                conn,
+                rows,
+                hashes,
+                report,
+                update_existing=not args.skip_existing,
+                progress=print_progress,
+            )
             print("Inserción de usuarios completada con éxito.")
+            print(json.dumps(report.as_dict(), ensure_ascii=False, indent=2))
             break  # Salir del bucle si la conexión fue exitosa
 
-        except psycopg2.OperationalError as e:
+        except psycopg.OperationalError as e:
             print(f"Error de conexión a la base de datos: {e}")
             if attempt < max_retries - 1:
                 print(f"Esperando {retry_delay} segundos antes de reintentar...")
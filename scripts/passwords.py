@@ -0,0 +1,138 @@
+"""
+Hashing de contrasenas compartido por el backend y los scripts.
+
+Los hashes nuevos usan un KDF lento de hashlib (scrypt o PBKDF2-SHA256) con sal
+aleatoria y el coste guardado en el propio hash, p. ej.:
+
+    $scrypt$n=16384,r=8,p=1$<sal>$<hash>
+    $pbkdf2-sha256$i=600000$<sal>$<hash>
+
+Los SHA-256 hexadecimales sin sal de la version anterior se siguen verificando;
+needs_rehash() indica cuando conviene reemplazarlos (o subir el coste).
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+from typing import Dict, Optional
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+LEGACY_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _parse_params(text: str) -> Dict[str, int]:
+    return {key: int(value) for key, value in (item.split("=", 1) for item in text.split(","))}
+
+
+class ScryptHasher:
+    scheme = "scrypt"
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1):
+        self.params = {"n": n, "r": r, "p": p}
+
+    @staticmethod
+    def derive(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        # OpenSSL rechaza por defecto mas de 32 MiB; se reserva justo lo que pide el coste
+        maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+        return hashlib.scrypt(
+            password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=KEY_BYTES
+        )
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        key = self.derive(password, salt, **self.params)
+        params = ",".join(f"{name}={value}" for name, value in self.params.items())
+        return f"${self.scheme}${params}${_b64encode(salt)}${_b64encode(key)}"
+
+    def verify(self, password: str, params: Dict[str, int], salt: bytes, key: bytes) -> bool:
+        candidate = self.derive(password, salt, params["n"], params["r"], params["p"])
+        return hmac.compare_digest(candidate, key)
+
+
+class Pbkdf2Hasher:
+    scheme = "pbkdf2-sha256"
+
+    def __init__(self, iterations: int = 600_000):
+        self.params = {"i": iterations}
+
+    @staticmethod
+    def derive(password: str, salt: bytes, iterations: int) -> bytes:
+        return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, KEY_BYTES)
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        key = self.derive(password, salt, self.params["i"])
+        return f"${self.scheme}$i={self.params['i']}${_b64encode(salt)}${_b64encode(key)}"
+
+    def verify(self, password: str, params: Dict[str, int], salt: bytes, key: bytes) -> bool:
+        return hmac.compare_digest(self.derive(password, salt, params["i"]), key)
+
+
+HASHERS = {
+    ScryptHasher.scheme: ScryptHasher,
+    Pbkdf2Hasher.scheme: Pbkdf2Hasher,
+}
+
+
+def hasher_from_env():
+    """Construye el hasher por defecto a partir de PASSWORD_HASH_SCHEME y sus parametros de coste."""
+    scheme = os.getenv("PASSWORD_HASH_SCHEME", ScryptHasher.scheme)
+    if scheme == ScryptHasher.scheme:
+        return ScryptHasher(
+            n=int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14))),
+            r=int(os.getenv("PASSWORD_SCRYPT_R", "8")),
+            p=int(os.getenv("PASSWORD_SCRYPT_P", "1")),
+        )
+    if scheme == Pbkdf2Hasher.scheme:
+        return Pbkdf2Hasher(iterations=int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000")))
+    raise ValueError(f"PASSWORD_HASH_SCHEME no soportado: {scheme}")
+
+
+default_hasher = hasher_from_env()
+
+
+def _split(stored_hash: str) -> Optional[tuple]:
+    parts = stored_hash.split("$")
+    if len(parts) != 5 or parts[0] or parts[1] not in HASHERS:
+        return None
+    try:
+        return parts[1], _parse_params(parts[2]), _b64decode(parts[3]), _b64decode(parts[4])
+    except (ValueError, KeyError):
+        return None
+
+
+def hash_password(password: str, hasher=None) -> str:
+    return (hasher or default_hasher).hash(password)
+
+
+def verify_password(plain_password: str, stored_hash: str) -> bool:
+    if LEGACY_SHA256_RE.match(stored_hash):
+        legacy = hashlib.sha256(plain_password.encode("utf-8")).hexdigest()
+        return hmac.compare_digest(legacy, stored_hash)
+
+    parsed = _split(stored_hash)
+    if parsed is None:
+        return False
+    scheme, params, salt, key = parsed
+    # Un hash corrupto (faltan parametros o el coste no es valido para el KDF) no verifica nada
+    try:
+        return HASHERS[scheme]().verify(plain_password, params, salt, key)
+    except (ValueError, KeyError):
+        return False
+
+
+def needs_rehash(stored_hash: str, hasher=None) -> bool:
+    """True si el hash es legacy o no usa el esquema y coste configurados."""
+    hasher = hasher or default_hasher
+    parsed = _split(stored_hash)
+    return parsed is None or parsed[0] != hasher.scheme or parsed[1] != hasher.params